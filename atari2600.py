@@ -0,0 +1,329 @@
+#
+# Atari 2600 console
+#
+# System (memory), cpu, TIA and RIOT wired together. Each Atari2600 instance
+# owns its own devices, so several independent consoles can live in the same
+# process:
+#
+#   atari = Atari2600("prueba.bin")
+#   atari.run(60)            # 60 frames
+#   atari.tia.screen         # last frame (palette indices)
+#
+import time
+import struct
+from tia import TIA
+from riot import RIOT
+from cpu import cpu, BUS_TIA
+
+#
+# Memory map
+#
+# There are mirrors for several memory areas, i.e.: the 8K addressable space
+# (13 bits) is mirrored at 0x0000, 0x2000, ..., 0xE000. Every address is
+# decoded into the physical address (System.memory index) of its device:
+#
+#   ROM:   xxx1 NNNN NNNN NNNN   0x1000 - 0x1FFF
+#          Mirrors: 0x1000, 0x3000, ..., 0xF000
+#
+#   TIA:   xxx0 xxxx 0xNN NNNN   0x00 - 0x3F (write), 0x100 - 0x10D (read, relocated)
+#          Mirrors: 0x0000, 0x0040, 0x0100, 0x0140, ..., 0x0F00, 0x0F40
+#          14 read-only registers mirrored 4 times inside each 64 address space
+#          45 write-only registers
+#
+#   RIOT:  xxx0 xxMx 1NNN NNNN   RAM: 0x80 - 0xFF, I/O and timer: 0x280 - 0x2FF
+#          M is mode (0: RAM, 1: I/O+Timer)
+#          Mirrors: RAM: 0x0080, 0x0180, 0x0480, 0x0580, ..., 0x0C80, 0x0D80
+#                   I/O: 0x0280, 0x0380, 0x0680, 0x0780, ..., 0x0E80, 0x0F80
+#
+# (see the bus decode tables in cpu.py)
+#
+class System:
+    def __init__(self):
+        self.clk_cycles = 0 # Color clock within the current scanline
+        self.line_start = 0 # CPU cycles elapsed before the current scanline
+        # Whole address space in a single buffer (physical addresses, see
+        # the memory map above). Device windows are zero-copy views on
+        # it, i.e.: np.frombuffer(system.ram, np.uint8) does not copy either
+        self.memory = bytearray(2**13)
+        view = memoryview(self.memory)
+        self.tia_w = view[0x0000:0x0040] # TIA write-only registers
+        self.ram   = view[0x0080:0x0100] # RIOT RAM (128 bytes)
+        self.tia_r = view[0x0100:0x0110] # TIA read-only registers (relocated)
+        self.riot  = view[0x0280:0x0300] # RIOT I/O and timer registers
+        self.rom   = view[0x1000:0x2000] # Cartridge ROM window (4KB)
+
+    def load_rom(self, rom):
+        ''' Copy a cartridge image into the ROM window. Smaller images
+            (i.e.: 2KB) are mirrored to fill the whole window
+        '''
+        for offset in range(0, len(self.rom), len(rom)):
+            self.rom[offset:offset + len(rom)] = rom[:len(self.rom) - offset]
+
+    def dump(self):
+        print("\nSYSTEM\n")
+        print("clk_cycles {}\n".format(self.clk_cycles))
+        print("Memory\n")
+        print("TBD\n")
+        #for i in range(0,0x2C, 0x10):
+        #    print(("{:02X} "*0x10).format(*memory[i:i+0x10]))
+
+
+class Atari2600:
+
+    LINE_CYCLES     = 76    # CPU cycles per scanline
+    MAX_FRAME_LINES = 1000  # step_frame gives up if VSYNC does not come (no ROM, bad kernel...)
+    RESET_VECTOR    = 0x1ffc
+
+    TIMING = ('cpu', 'tia', 'riot') # Subsystems timed (see _install_timing)
+
+    # Machine state (see save_state): version, System clk_cycles and line_start,
+    # followed by the cpu and RIOT states (fixed size), the memory and the TIA state
+    STATE = struct.Struct('<Hiq')
+    STATE_VERSION = 1
+
+    def __init__(self, rom=None, video=None, deferred=True, frameskip=1, translate=True, timing=False, tracer=None):
+        ''' rom:       cartridge image (bytes) or path to it (see load_rom)
+            video:     video output (see video.py). Default: headless
+            deferred, frameskip: TIA rendering options (see TIA)
+            translate: cpu basic block translation (see cpu._translate_block)
+            timing:    accumulate the time spent on each subsystem in
+                       self.timing (slower, see _install_timing)
+            tracer:    tracing.Tracer of the cpu/bus/tia/riot activity (see
+                       cpu.set_tracer), attached again on every reset
+        '''
+        self.video     = video
+        self.deferred  = deferred
+        self.frameskip = frameskip
+        self.translate = translate
+        self.tracer    = tracer
+        self.rom       = None
+
+        self.timed  = timing
+        self.timing = dict.fromkeys(Atari2600.TIMING, 0.0) # Seconds
+
+        self.reset()
+        if rom is not None:
+            self.load_rom(rom)
+
+    def load_rom(self, rom):
+        ''' Insert a cartridge and reset the console.
+            rom: cartridge image (bytes) or path to it
+        '''
+        if isinstance(rom, (bytes, bytearray)):
+            rom = bytes(rom)
+        else:
+            with open(rom, "rb") as f:
+                rom = f.read()
+        if not rom:
+            raise ValueError("Empty cartridge image")
+        self.rom = rom
+        self.reset()
+
+    def reset(self):
+        ''' Power-on: fresh devices, cartridge (if any) kept '''
+        self._build()
+
+        memory = self.system.memory
+
+        # Init input registers
+        memory[0x280] = 0xff
+        memory[0x281] = 0x00
+        memory[0x282] = 0x2f
+        memory[0x283] = 0x00 # Actually hardwired as input
+        memory[0x108] = 0x80
+        memory[0x109] = 0x80
+        memory[0x10a] = 0x80
+        memory[0x10b] = 0x80
+        memory[0x10c] = 0x80
+        memory[0x10d] = 0x80
+
+        if self.rom is not None:
+            self.system.load_rom(self.rom)
+            self.cpu.predecode()
+            vector = Atari2600.RESET_VECTOR
+            self.cpu.PC = memory[vector] | (memory[vector + 1] << 8)
+
+    def _build(self):
+        ''' New devices, wired together '''
+        self.system = System()
+        self.tia    = TIA(self.system, deferred=self.deferred, video=self.video, frameskip=self.frameskip)
+        self.riot   = RIOT(self.system)
+        self.cpu    = cpu(self.system, translate=self.translate)
+        self.cpu.riot = self.riot
+        self.cpu.tia  = self.tia
+        if hasattr(self.video, 'system'):
+            self.video.system = self.system # Input devices (i.e.: PygameVideo keyboard)
+        if self.tracer is not None:
+            self.cpu.set_tracer(self.tracer)
+        if self.timed:
+            self._install_timing()
+
+    def _install_timing(self):
+        ''' Time the cpu and device entry points called by step, adding up in
+            self.timing (the TIA includes the video output). The timed
+            wrappers are installed on these instances only: untimed consoles
+            run the plain methods
+        '''
+        timing = self.timing
+        clock  = time.perf_counter
+
+        def timed(obj, name, subsystem):
+            func = getattr(obj, name)
+            def timed_call(*args):
+                t0 = clock()
+                result = func(*args)
+                timing[subsystem] += clock() - t0
+                return result
+            setattr(obj, name, timed_call)
+
+        timed(self.cpu, 'run', 'cpu')
+        for name in ('write', 'line_update', '_prepare_next_line', 'frame_update'):
+            timed(self.tia, name, 'tia')
+        timed(self.riot, 'write', 'riot')
+
+    def save_state(self):
+        ''' Snapshot of the whole machine, as a compact bytes object (see
+            STATE). Only valid between steps. The framebuffer is not saved
+        '''
+        system = self.system
+        return b''.join((
+            Atari2600.STATE.pack(Atari2600.STATE_VERSION, system.clk_cycles, system.line_start),
+            self.cpu.save_state(),
+            self.riot.save_state(),
+            system.memory,
+            self.tia.save_state()))
+
+    def load_state(self, state):
+        ''' Restore a snapshot taken by save_state (of a console running the
+            same cartridge, or not: the ROM is in the memory)
+        '''
+        system, cpu = self.system, self.cpu
+
+        # Checked before anything is restored: a bad snapshot leaves the console as is
+        state = memoryview(state)
+        tia_offset = Atari2600.STATE.size + cpu.STATE.size + RIOT.STATE.size + len(system.memory)
+        if len(state) < tia_offset:
+            raise ValueError("Truncated state ({} bytes)".format(len(state)))
+        version, clk_cycles, line_start = Atari2600.STATE.unpack_from(state)
+        if version != Atari2600.STATE_VERSION:
+            raise ValueError("Unsupported state version {}".format(version))
+        tia_size = self.tia.state_size(state[tia_offset:])
+        if tia_size is None or len(state) != tia_offset + tia_size:
+            raise ValueError("Truncated or corrupted state ({} bytes)".format(len(state)))
+
+        system.clk_cycles, system.line_start = clk_cycles, line_start
+        offset = Atari2600.STATE.size
+
+        cpu.load_state(state[offset:offset + cpu.STATE.size])
+        offset += cpu.STATE.size
+        self.riot.load_state(state[offset:offset + RIOT.STATE.size])
+        offset += RIOT.STATE.size
+
+        memory = state[offset:offset + len(system.memory)]
+        offset += len(system.memory)
+        rom = memory[cpu.ROM_ADDR:cpu.ROM_ADDR + cpu.ROM_SIZE]
+        rom_changed = system.rom != rom
+        system.memory[:] = memory
+        # Translated/predecoded code is only kept if the code is still there
+        if cpu.code_mask.find(1, 0, cpu.ROM_ADDR) >= 0:
+            cpu._invalidate_blocks(0, cpu.ROM_ADDR)
+        if rom_changed:
+            self.rom = bytes(rom) # Cartridge of the snapshot (kept on reset)
+            cpu.predecode()
+
+        self.tia.load_state(state[offset:])
+
+    def clone(self, video=None):
+        ''' Independent copy of the console, in the same state and with the
+            same timing setting. Headless unless a video output is given, and
+            without the tracer. The devices are copied (see cpu.clone and
+            TIA.clone) instead of being built again
+        '''
+        other = Atari2600.__new__(Atari2600)
+        other.video     = video
+        other.deferred  = self.deferred
+        other.frameskip = self.frameskip
+        other.translate = self.translate
+        other.tracer    = None
+        other.rom       = self.rom
+        other.timed     = self.timed
+        other.timing    = dict.fromkeys(Atari2600.TIMING, 0.0)
+
+        other.system = System()
+        other.system.memory[:] = self.system.memory # Same code: nothing invalidated
+        other.tia  = self.tia.clone(other.system, video)
+        other.riot = RIOT(other.system)
+        other.cpu  = self.cpu.clone(other.system)
+        other.cpu.riot = other.riot
+        other.cpu.tia  = other.tia
+        if hasattr(video, 'system'):
+            video.system = other.system
+        if other.timed:
+            other._install_timing()
+
+        other.load_state(self.save_state())
+        return other
+
+    @property
+    def frame_cnt(self):
+        return self.tia.frame_cnt
+
+    @property
+    def cycles(self):
+        ''' CPU cycles elapsed since reset '''
+        return self.system.line_start + self.system.clk_cycles // 3
+
+    def step(self):
+        ''' Run the CPU until a device needs service (a whole line at most),
+            then update the devices
+        '''
+        if self.rom is None:
+            return # No cartridge: nothing to run
+
+        system, cpu, tia = self.system, self.cpu, self.tia
+
+        cpu.run(Atari2600.LINE_CYCLES)
+
+        # Devices: consume the register writes queued by the CPU (in order)
+        for clk, dev, addr, value in cpu.events:
+            if dev == BUS_TIA:
+                tia.write(addr, value, clk)
+            else:
+                self.riot.write(addr, value, clk)
+        del cpu.events[:]
+        cpu.TIA_UPDATE = cpu.RIOT_UPDATE = False
+
+        # TIA: draw TV line
+        if system.clk_cycles >= 228:
+
+            tia.line_update()
+            system.clk_cycles %= 228
+            system.line_start += Atari2600.LINE_CYCLES
+
+            tia._prepare_next_line()
+            if tia.vsync == 2:
+                tia.vsync = 0
+                tia.frame_update()
+                tia.line = 3
+
+    def step_frame(self):
+        ''' Run until the end of the current frame (VSYNC).
+            Returns False if the frame did not end (no cartridge, or no VSYNC
+            in MAX_FRAME_LINES lines)
+        '''
+        if self.rom is None:
+            return False
+        frame = self.tia.frame_cnt
+        limit = self.system.line_start + Atari2600.MAX_FRAME_LINES * Atari2600.LINE_CYCLES
+        while self.tia.frame_cnt == frame and self.system.line_start < limit:
+            self.step()
+        return self.tia.frame_cnt != frame
+
+    def run(self, frames):
+        ''' Run 'frames' frames. Returns False if a frame did not end (see
+            step_frame)
+        '''
+        for i in range(frames):
+            if not self.step_frame():
+                return False
+        return True
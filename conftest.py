@@ -0,0 +1,55 @@
+#
+# Test cartridge: a minimal NTSC kernel whose frames all differ (the background
+# color of each line depends on a frame counter kept in RAM)
+#
+import pytest
+
+def kernel_rom():
+    code = bytes([
+        0x78,             # F000        SEI
+        0xd8,             # F001        CLD
+        0xa2, 0xff,       # F002        LDX #$FF
+        0x9a,             # F004        TXS
+        0xa9, 0x00,       # F005        LDA #0
+        0x85, 0x80,       # F007        STA $80       frame counter
+                          #      frame:
+        0xa9, 0x02,       # F009        LDA #2
+        0x85, 0x00,       # F00B        STA VSYNC
+        0x85, 0x02,       # F00D        STA WSYNC     3 lines of VSYNC
+        0x85, 0x02,       # F00F        STA WSYNC
+        0x85, 0x02,       # F011        STA WSYNC
+        0xa9, 0x00,       # F013        LDA #0
+        0x85, 0x00,       # F015        STA VSYNC
+        0xa9, 0x02,       # F017        LDA #2
+        0x85, 0x01,       # F019        STA VBLANK
+        0xa2, 0x25,       # F01B        LDX #37
+        0x85, 0x02,       # F01D vbl:   STA WSYNC
+        0xca,             # F01F        DEX
+        0xd0, 0xfb,       # F020        BNE vbl
+        0xa9, 0x00,       # F022        LDA #0
+        0x85, 0x01,       # F024        STA VBLANK
+        0xe6, 0x80,       # F026        INC $80
+        0xa2, 0xc0,       # F028        LDX #192
+        0x8a,             # F02A pic:   TXA
+        0x18,             # F02B        CLC
+        0x65, 0x80,       # F02C        ADC $80
+        0x85, 0x09,       # F02E        STA COLUBK
+        0x85, 0x02,       # F030        STA WSYNC
+        0xca,             # F032        DEX
+        0xd0, 0xf5,       # F033        BNE pic
+        0xa9, 0x02,       # F035        LDA #2
+        0x85, 0x01,       # F037        STA VBLANK
+        0xa2, 0x1e,       # F039        LDX #30
+        0x85, 0x02,       # F03B ovs:   STA WSYNC
+        0xca,             # F03D        DEX
+        0xd0, 0xfb,       # F03E        BNE ovs
+        0x4c, 0x09, 0xf0, # F040        JMP frame
+    ])
+    rom = bytearray(0x1000)
+    rom[:len(code)] = code
+    rom[0xffc:0xffe] = bytes([0x00, 0xf0]) # Reset vector: F000
+    return bytes(rom)
+
+@pytest.fixture
+def rom():
+    return kernel_rom()
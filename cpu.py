@@ -1,21 +1,152 @@
 import sys
+import types
+import struct
+from array import array
+
+import tracing
 
 def print_debug(text):
     pass
     #print(text)
 
 
+#
+# Fused opcode handlers
+#
+# Source templates used to inline each addressing mode into the generated
+# per-opcode handlers (see cpu._build_handlers). Keyed by the name of the
+# addressing mode method in opcode_table:
+#   [operand address/value code, page crossed condition]
+# '{op}' is replaced by the operand fetch code (1 or 2 bytes after the opcode).
+# Modes not listed here fall back to calling the addressing mode method.
+_MODE_SRC = {
+    'NONE':                ['addr = 0',                                      None],
+    'IMMEDIATE':           ['addr = {op}',                                   None],
+    'RELATIVE':            ['addr = {op}\n'
+                            '    if addr >= 0x80: addr -= 0x100',             None],
+    'MEM_READ_ZEROPAGE':   ['addr = {op} & 0xff',                            None],
+    'MEM_READ_ZEROPAGE_X': ['addr = ({op} + self.X) & 0xff',                 None],
+    'MEM_READ_ZEROPAGE_Y': ['addr = ({op} + self.Y) & 0xff',                 None],
+    'MEM_READ_ABSOLUTE':   ['addr = {op}',                                   None],
+    'MEM_READ_ABSOLUTE_X': ['addr = {op} + self.X',                          '(addr & 0xff) < self.X'],
+    'MEM_READ_ABSOLUTE_Y': ['addr = {op} + self.Y',                          '(addr & 0xff) < self.Y'],
+    'MEM_READ_INDIRECT_X': ['addr = ({op} + self.X) & 0xff\n'
+                            '    addr = read(addr) | (read((addr + 1) & 0xff) << 8)', None],
+    'MEM_READ_INDIRECT_Y': ['addr = {op}\n'
+                            '    addr = (read(addr) | (read((addr + 1) & 0xff) << 8)) + self.Y',
+                                                                             '(addr & 0xff) < self.Y'],
+}
+
+_OPERAND_SRC = {
+    1: None,
+    2: 'read(pc + 1)',
+    3: '(read(pc + 1) + (read(pc + 2) << 8))',
+}
+
+
+#
+# Memory bus decode
+#
+# Every 13-bit address is decoded once (mirrors included, see the memory map in
+# atari2600.py) into the physical address to access and the device behind
+# it, so a memory access is a single table lookup:
+#   _READ_MAP[addr]:  physical address read
+#   _WRITE_MAP[addr]: physical address written
+#   _WRITE_DEV[addr]: device written (BUS_xxx)
+BUS_RAM      = 0
+BUS_TIA      = 1
+BUS_RIOT     = 2
+BUS_ROM      = 3
+BUS_TIA_SYNC = 4  # TIA registers the CPU must wait for (WSYNC, RSYNC, CXCLR)
+
+_TIA_SYNC_REGS = (0x02, 0x03, 0x2C)
+
+def _build_bus_maps():
+
+    read_map  = [0] * 0x2000
+    write_map = [0] * 0x2000
+    write_dev = [0] * 0x2000
+
+    for addr in range(0x2000):
+        if addr & 0x1000:
+            # ROM: 0x1000 - 0x1FFF
+            read = write = addr
+            dev  = BUS_ROM
+        elif addr & 0x80:
+            if addr & 0x200:
+                # RIOT I/O + timer: 0x280 - 0x2FF. On read, A2 selects the
+                # timer (A0: INTIM 0x284 / TIMINT 0x285) or the I/O ports
+                # (A1-A0: 0x280 - 0x283)
+                read  = 0x284 | (addr & 0x01) if addr & 0x04 else addr & 0x283
+                write = addr & 0x2ff
+                dev   = BUS_RIOT
+            else:
+                # RIOT RAM: 0x80 - 0xFF
+                read = write = addr & 0xff
+                dev  = BUS_RAM
+        else:
+            # TIA: 0x00 - 0x3F. Only 4 address bits are decoded on read, and
+            # read-only registers are relocated to 0x100 - 0x10F to avoid
+            # collision with write-only registers
+            read  = (addr & 0x0f) + 0x100
+            write = addr & 0x3f
+            dev   = BUS_TIA_SYNC if write in _TIA_SYNC_REGS else BUS_TIA
+        read_map[addr]  = read
+        write_map[addr] = write
+        write_dev[addr] = dev
+
+    return read_map, write_map, write_dev
+
+_READ_MAP, _WRITE_MAP, _WRITE_DEV = _build_bus_maps()
+
+
 class cpu:
 
     MAX_MEM_ADDR = 0x1fff # 8KB-1 (13-bits)
 
+    _handlers_cache = {} # opcodes table -> fused handlers (see _build_handlers)
+
+    MAX_BLOCK_LEN = 32    # Max number of instructions in a translated block
+    MAX_IDLE_LEN  = 4     # Max number of instructions in a polling loop (see _idle_loop)
 
-    def __init__(self, system):
+    # Predecoded cartridge ROM (see predecode)
+    ROM_ADDR    = 0x1000  # ROM physical address (4KB bank)
+    ROM_SIZE    = 0x1000
+    DECODE_MISS = 0x100   # Entry not predecoded: fetch it from memory
+
+    # Registers and flags (see save_state): A, X, Y, PC, SP, P, C, nz, page_crossed
+    STATE = struct.Struct('<9i')
+
+    # run() stop reasons
+    STOP_BUDGET = 0       # Cycles budget consumed
+    STOP_TIA    = 1       # TIA sync register written (tia_addr: WSYNC, RSYNC or CXCLR)
+    STOP_RIOT   = 2       # RIOT register written
+    STOP_LINE   = 3       # End of scanline reached (system.clk_cycles >= 228)
+
+    # Operations writing memory through MEM_WRITE (they may hit TIA/RIOT registers)
+    _STORE_OPS = {'staMem_', 'stxMem_', 'styMem_', 'incMem_', 'decMem_',
+                  'aslMem_', 'lsrMem_', 'rolMem_', 'rorMem_'}
+    # Operations returning extra cycles
+    _BRANCH_OPS = {'bcc_', 'bcs_', 'beq_', 'bmi_', 'bne_', 'bpl_', 'bvc_', 'bvs_'}
+    # Operations changing the program flow (they end a translated block)
+    _FLOW_OPS  = {'bcc_', 'bcs_', 'beq_', 'bmi_', 'bne_', 'bpl_', 'bvc_', 'bvs_',
+                  'jmp_', 'jsr_', 'rts_', 'rti_', 'brk_'}
+    # Operations allowed in a polling loop (see _idle_loop): registers and
+    # flags only depend on what is read, the same on every iteration
+    _POLL_OPS = {'lda_', 'ldx_', 'ldy_', 'ldaMem_', 'ldxMem_', 'ldyMem_',
+                 'and_', 'andMem_', 'ora_', 'oraMem_', 'bit_',
+                 'cmp_', 'cmpMem_', 'cpx_', 'cpxMem_', 'cpy_', 'cpyMem_', 'nop_'}
+    # Addressing modes whose result only depends on the operand bytes
+    _STATIC_MODES = {'NONE', 'IMMEDIATE', 'RELATIVE', 'MEM_READ_ZEROPAGE', 'MEM_READ_ABSOLUTE'}
+
+    def __init__(self, system, translate=False):
 
         self.A = self.X = self.Y = 0                      # Registers
         self.PC = 0                             # Program counter
         self.SP = 0                             # Stack pointer
-        self.N = self.V = self.B = self.D = self.I = self.Z = self.C = False  # Status flags
+        self.P  = 0x20                          # Status flags: V, B, D, I (see PSW_GET)
+        self.C  = 0                             # Carry flag
+        self.nz = 1                             # Last result, N and Z flags are derived from it
 
         self.system = system
 
@@ -23,17 +154,40 @@ class cpu:
         self.frame_cnt = 0
         self.total_cycles = 0
         #
-        self.TIA_UPDATE = False
+        # Device register writes, pending to be consumed by the devices:
+        #   (clk_cycles, device (BUS_TIA/BUS_RIOT), register, value)
+        # clk_cycles is the color clock at the end of the writing instruction.
+        # Devices consume them in batches (end of line, or when the CPU stops
+        # at a write it must wait for, see run)
+        self.events = []
+
+        self.TIA_UPDATE = False # TIA sync register written
         self.tia_addr  = 0
-        self.tia_value = 0
+        self.tia = None # TIA device: collision latches are read from it (see tia.py)
         
         #RIOT (PIA 6532)
         self.RIOT_UPDATE = False
-        self.riot_addr  = 0
-        self.riot_value = 0
+        self.riot = None # RIOT device: timer registers are read from it (see riot.py)
 
         self.mem_write = 0
         self.mem_read = 0
+
+        self.tracer = None # see set_tracer
+        self.untraced_translate = translate # translate setting restored when the tracer is detached
+
+        # Basic block translation (see _translate_block and run)
+        self.translate    = translate
+        self.blocks       = {}  # PC -> translated block
+        self.block_ranges = {}  # PC -> physical address range [first, last) covered by the block
+        self.code_mask    = bytearray(cpu.MAX_MEM_ADDR + 1) # 1 if address is covered by any block
+
+        # Memory bus decode tables (see _build_bus_maps)
+        self.read_map  = _READ_MAP
+        self.write_map = _WRITE_MAP
+        self.write_dev = _WRITE_DEV
+
+        # Predecoded ROM, one entry per ROM address (see predecode)
+        self.rom_decoded  = array('I', [cpu.DECODE_MISS]) * cpu.ROM_SIZE
         
         
         # opcodes table
@@ -303,57 +457,57 @@ class cpu:
         # TYA                 self.           self.                       
         self.opcode_table[0x98] = [self.tya_,      self.NONE,                  1,     2,      0]
 
+        # Fused handlers (one per opcode) generated from the opcodes table
+        self.handlers     = self._build_handlers()
+        self.rom_handlers = self._build_handlers(predecoded=True)
+
 
     # Memory bus operation
     def MEM_WRITE(self, addr, value):
     
         self.mem_write = 1
     
-        addr &= cpu.MAX_MEM_ADDR
-    
-        if addr >= 0x40 and addr < 0x80:
-            print_debug("ZERO PAGE 0x{:02X}".format(addr))
-            addr -= 0x40
-            #sys.exit()
-    
-        if addr != 0x282: # Port B is hardwired as input. Ignore write operations on it
+        dev  = self.write_dev[addr & cpu.MAX_MEM_ADDR]
+        addr = self.write_map[addr & cpu.MAX_MEM_ADDR]
+
+        if dev == BUS_TIA:
             self.system.memory[addr] = value
-        
-        #if addr > 0x30 and addr < 0x3f:
-        #    print( 'WTF' )
-        #    #sys.exit()
-    
-        # TIA register (0x00 - 0x80)
-        if addr < 0x80:
+            self.events.append((self.system.clk_cycles, BUS_TIA, addr, value))
+
+        elif dev == BUS_RAM:
+            self.system.memory[addr] = value
+            if self.code_mask[addr]: # translated code overwritten
+                self._invalidate_blocks(addr)
+
+        elif dev == BUS_TIA_SYNC:
+            self.system.memory[addr] = value
+            self.events.append((self.system.clk_cycles, BUS_TIA, addr, value))
             self.TIA_UPDATE = True
             self.tia_addr  = addr
-            self.tia_value = value
-    
-            if addr > 0x3f:
-                print_debug('W_ADDR {}'.format(hex(addr)))
-    
-        if addr >= 0x280:
+
+        elif dev == BUS_RIOT:
+            if addr != 0x282: # Port B is hardwired as input. Ignore write operations on it
+                self.system.memory[addr] = value
+            self.events.append((self.system.clk_cycles, BUS_RIOT, addr, value))
             self.RIOT_UPDATE = True
-            self.riot_addr  = addr
-            self.riot_value = value
-            print_debug('W_ADDR 0x{:4X}, val:{}'.format(addr, value))
-    
+
+        else: # ROM
+            self.system.memory[addr] = value
+            if self.code_mask[addr]: # translated code overwritten
+                self._invalidate_blocks(addr)
+            # predecoded instructions overwritten
+            self.predecode(addr - cpu.ROM_ADDR - 2, addr - cpu.ROM_ADDR + 1)
                 
     def MEM_READ(self, addr):
     
         self.mem_read = 1
     
-        addr &= cpu.MAX_MEM_ADDR
-    
-        if addr >= 0x40 and addr < 0x80:
-            print_debug("ZERO PAGE {}".format(addr))
-            addr -= 0x40
-            sys.exit()
-    
-        if addr < 0x0E or (addr >= 0x30 and addr < 0x3E):
-            addr = (addr & 0x0F) + 0x100 # fake address for read-only TIA registers
-        #    return tia_rd[addr & 0x0F]
-    
+        addr = self.read_map[addr & cpu.MAX_MEM_ADDR]
+        if 0x100 <= addr < 0x300: # Device registers computed on read
+            if addr < 0x108:                   # TIA collision latches
+                return self.tia.read(addr & 0x0f)
+            if addr == 0x284 or addr == 0x285: # RIOT timer
+                return self.riot.read(addr)
         return self.system.memory[addr]
     
     #
@@ -406,7 +560,7 @@ class cpu:
         return addr
     
     def MEM_READ_INDIRECT_X(self, addr):
-        addr = (addr + X) & 0xff
+        addr = (addr + self.X) & 0xff
         addr = self.MEM_READ(addr) | (self.MEM_READ((addr + 1) & 0xff) << 8)
         return addr
     
@@ -454,26 +608,56 @@ class cpu:
     #
     # Flags status byte
     #
+    # Lazy flags: N and Z are not computed by each operation. The last result
+    # is kept in 'nz' and the flags are derived from it only when needed
+    # (branches, PHP, BIT, ...):
+    #   Z = (nz & 0xff) == 0
+    #   N = (nz & 0x180) != 0   (bit 8 lets BIT set N and Z independently)
+    # C is kept apart (0/1) since it is an operand of ADC/SBC/ROL/ROR.
+    # V, B, D and I are rarely modified, so they stay packed in P.
+    #
+    #   N V - B D I Z C
+    #   7 6 5 4 3 2 1 0
     def PSW_GET(self):
-        tmp = 0
-        if self.C == True: tmp |= 0x01 # inventado..mirar status byte 
-        if self.Z == True: tmp |= 0x02
-        if self.I == True: tmp |= 0x04
-        if self.D == True: tmp |= 0x08
-        if self.B == True: tmp |= 0x10
-        if self.V == True: tmp |= 0x20
-        if self.N == True: tmp |= 0x40
-        return tmp
+        nz = self.nz
+        return self.P | self.C | (0 if nz & 0xff else 0x02) | ((nz | (nz >> 1)) & 0x80)
     
     def PSW_SET(self, val):
         
-        self.C = val&0x01 != 0
-        self.Z = val&0x02 != 0
-        self.I = val&0x04 != 0
-        self.D = val&0x08 != 0
-        self.B = val&0x10 != 0
-        self.V = val&0x20 != 0
-        self.N = val&0x40 != 0
+        self.P  = (val & 0x5c) | 0x20
+        self.C  = val & 0x01
+        self.nz = ((val & 0x80) << 1) | ((val & 0x02) ^ 0x02)
+
+    # Status flags as booleans (debugging, state dumps, ...)
+    @property
+    def N(self): return (self.nz & 0x180) != 0
+    @N.setter
+    def N(self, val): self.PSW_SET((self.PSW_GET() & 0x7f) | (0x80 if val else 0))
+
+    @property
+    def Z(self): return (self.nz & 0xff) == 0
+    @Z.setter
+    def Z(self, val): self.PSW_SET((self.PSW_GET() & 0xfd) | (0x02 if val else 0))
+
+    @property
+    def V(self): return (self.P & 0x40) != 0
+    @V.setter
+    def V(self, val): self.P = (self.P & 0xbf) | (0x40 if val else 0)
+
+    @property
+    def B(self): return (self.P & 0x10) != 0
+    @B.setter
+    def B(self, val): self.P = (self.P & 0xef) | (0x10 if val else 0)
+
+    @property
+    def D(self): return (self.P & 0x08) != 0
+    @D.setter
+    def D(self, val): self.P = (self.P & 0xf7) | (0x08 if val else 0)
+
+    @property
+    def I(self): return (self.P & 0x04) != 0
+    @I.setter
+    def I(self, val): self.P = (self.P & 0xfb) | (0x04 if val else 0)
 
     #
     # Opcodes definition
@@ -488,12 +672,10 @@ class cpu:
     def adc_(self, val):
     
         res = self.A + val + self.C
-        self.C = res > 255
+        self.C = res >> 8
         res &= 0xff
-        self.V = (self.A^res)&(val^res)&0x80 != 0
-        self.Z = res == 0
-        self.N = (res & 0x80) != 0
-        self.A = res
+        self.P = (self.P & 0xbf) | (((self.A^res)&(val^res)&0x80) >> 1)
+        self.A = self.nz = res
     
         return 0
     
@@ -503,9 +685,7 @@ class cpu:
     # AND
     def and_(self, val):
     
-        self.A = (self.A & val)
-        self.Z = (self.A == 0)
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = self.A & val
     
         return 0
     
@@ -516,10 +696,8 @@ class cpu:
     def aslAcc_(self, unused):
     
         res = self.A << 1
-        self.A = res & 0xff
-        self.C = (res > 0xff)
-        self.Z = (self.A == 0)
-        self.N = (self.A & 0x80) != 0
+        self.C = res >> 8
+        self.A = self.nz = res & 0xff
     
         return 0
     
@@ -527,11 +705,9 @@ class cpu:
     def aslMem_(self, addr):
     
         res = self.MEM_READ(addr) << 1
-        val = res & 0xff
+        self.C = res >> 8
+        self.nz = val = res & 0xff
         self.MEM_WRITE(addr, val)
-        self.C = (res > 0xff)
-        self.Z = (val == 0)
-        self.N = (val & 0x80) != 0
     
         return 0
     
@@ -549,47 +725,48 @@ class cpu:
     
     # BCC
     def bcc_(self, addr):
-        return self.bAny_(addr, self.C == False)
+        return self.bAny_(addr, not self.C)
     
     # BCS
     def bcs_(self, addr):
-        return self.bAny_(addr, self.C == True)
+        return self.bAny_(addr, self.C)
     
     # BEQ
     def beq_(self, addr):
-        return self.bAny_(addr, self.Z == True)
+        return self.bAny_(addr, not (self.nz & 0xff))
     
     # BIT
     def bit_(self, addr):
     
         val = self.MEM_READ(addr)
-        self.Z = (val & self.A) == 0
-        self.V = (val & 0x40) != 0
-        self.N = (val & 0x80) != 0
+        self.nz = ((val & 0x80) << 1) | ((val & self.A) != 0)
+        self.P  = (self.P & 0xbf) | (val & 0x40)
     
         return 0
     
     # BMI
     def bmi_(self, addr):
-        return self.bAny_(addr, self.N == True)
+        return self.bAny_(addr, self.nz & 0x180)
     
     # BNE
     def bne_(self, addr):
-        return self.bAny_(addr, self.Z == False)
+        return self.bAny_(addr, self.nz & 0xff)
     
     # BPL
     def bpl_(self, addr):
-        return self.bAny_(addr, self.N == False)
+        return self.bAny_(addr, not (self.nz & 0x180))
     
     # BRK
     def brk_(self, unused):
     
-        self.B = 1
+        self.P |= 0x10
         # push PC and SP to stack
         rti_PC = self.PC + 1
         self.system.memory[self.SP]     = rti_PC >> 8
         self.system.memory[self.SP - 1] = rti_PC & 0xff
         self.system.memory[self.SP - 2] = self.PSW_GET()
+        if self.code_mask.find(1, self.SP - 2, self.SP + 1) >= 0: # translated code overwritten
+            self._invalidate_blocks(self.SP - 2, self.SP + 1)
         self.SP -= 3
         # PC = interrupt vector
         self.PC = (self.MEM_READ(self.MEM_READ_ABSOLUTE(0xfffe)) | self.MEM_READ(self.MEM_READ_ABSOLUTE(0xffff))<<8)
@@ -599,145 +776,125 @@ class cpu:
     
     # BVC
     def bvc_(self, addr):
-        return self.bAny_(addr, self.V == False)
+        return self.bAny_(addr, not (self.P & 0x40))
     
     # BVC
     def bvs_(self, addr):
-        return self.bAny_(addr, self.V == True)
+        return self.bAny_(addr, self.P & 0x40)
     
     # CLC
     def clc_(self, val):
     
-        self.C = False
+        self.C = 0
     
         return 0
     
     # CLD
     def cld_(self, val):
     
-        self.D = False
+        self.P &= 0xf7
     
         return 0    
     
     # CLI
     def cli_(self, val):
     
-        self.I = False
+        self.P &= 0xfb
     
         return 0
     
     # CLV
     def clv_(self, val):
     
-        self.V = False
+        self.P &= 0xbf
     
         return 0
         
     # CMP
     def cmp_(self, val):
     
-        self.Z = self.A == val
-        self.C = self.A >= val
-        self.N = (((self.A - val)%256) & 0x80) != 0
+        res = self.A - val
+        self.C  = res >= 0
+        self.nz = res & 0xff
     
         return 0
     
     def cmpMem_(self, addr):
-        return cmp_(self.MEM_READ(addr))
+        return self.cmp_(self.MEM_READ(addr))
     
     # CPX
     def cpx_(self, val):
     
-        self.Z = self.X == val
-        self.C = self.X >= val
-        self.N = (((self.X - val)%256) & 0x80) != 0
+        res = self.X - val
+        self.C  = res >= 0
+        self.nz = res & 0xff
     
         return 0
     
     def cpxMem_(self, addr):
-        return cpx_(self.MEM_READ(addr))
+        return self.cpx_(self.MEM_READ(addr))
     
     # CPY
     def cpy_(self, val):
     
-        self.Z = self.Y == val
-        self.C = self.Y >= val
-        self.N = (((self.Y - val)%256) & 0x80) != 0
+        res = self.Y - val
+        self.C  = res >= 0
+        self.nz = res & 0xff
     
         return 0
     
     def cpyMem_(self, addr):
-        return cpy_(self.MEM_READ(addr))
+        return self.cpy_(self.MEM_READ(addr))
     
     # DEC
     def decMem_(self, addr):
     
-        val = (self.MEM_READ(addr) - 1) & 0xff
+        self.nz = val = (self.MEM_READ(addr) - 1) & 0xff
         self.MEM_WRITE(addr, val)
-        self.Z = val == 0
-        self.N = (val & 0x80) != 0
     
         return 0
     
     # DEX
     def dex_(self, val):
     
-        self.X = (self.X - 1) & 0xff
-        self.Z = (self.X == 0)
-        self.N = (self.X & 0x80) != 0
+        self.X = self.nz = (self.X - 1) & 0xff
     
         return 0
     
     # DEY
     def dey_(self, val):
     
-        self.Y = (self.Y - 1) & 0xff 
-        self.Z = (self.Y == 0)
-        self.N = (self.Y & 0x80) != 0
+        self.Y = self.nz = (self.Y - 1) & 0xff 
     
         return 0
     
     # EOR
     def eor_(self, val):
     
-        self.A ^= val
-        self.Z = self.A == 0
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = self.A ^ val
     
         return 0
     
     def eorMem_(self, addr):
-    
-        val = self.MEM_READ(addr)
-        self.A ^= val
-        self.Z = self.A == 0
-        self.N = (self.A & 0x80) != 0
-    
-        return 0
+        return self.eor_(self.MEM_READ(addr))
     
     # INC
     def incMem_(self, addr):
     
-        val = (self.MEM_READ(addr) + 1) & 0xff
-        self.MEM_WRITE_ZEROPAGE(addr, val)
-        self.Z = val == 0
-        self.N = (val & 0x80) != 0
+        self.nz = val = (self.MEM_READ(addr) + 1) & 0xff
+        self.MEM_WRITE(addr, val)
     
         return 0
     
     def inx_(self, val):    
     
-        self.X = (self.X + 1) & 0xff
-        self.Z = (self.X == 0)
-        self.N = (self.X & 0x80) != 0
+        self.X = self.nz = (self.X + 1) & 0xff
     
         return 0
     
     def iny_(self, val):    
     
-        self.Y = (self.Y + 1) & 0xff
-        self.Z = (self.Y == 0)
-        self.N = (self.Y & 0x80) != 0
+        self.Y = self.nz = (self.Y + 1) & 0xff
     
         return 0
     
@@ -754,6 +911,8 @@ class cpu:
         self.PC -= 1
         self.system.memory[self.SP]     = self.PC >> 8
         self.system.memory[self.SP - 1] = self.PC & 0xff
+        if self.code_mask.find(1, self.SP - 1, self.SP + 1) >= 0: # translated code overwritten
+            self._invalidate_blocks(self.SP - 1, self.SP + 1)
         self.SP -= 2
         # update PC
         self.PC = val
@@ -763,9 +922,7 @@ class cpu:
     # LDA
     def lda_(self, val):    
     
-        self.A = val
-        self.Z = self.A == 0
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = val
         
         return 0
     
@@ -775,9 +932,7 @@ class cpu:
     # LDX
     def ldx_(self, val):    
     
-        self.X = val
-        self.Z = self.X == 0
-        self.N = (self.X & 0x80) != 0
+        self.X = self.nz = val
     
         return 0
     
@@ -787,9 +942,7 @@ class cpu:
     # LDY
     def ldy_(self, val):    
     
-        self.Y = val
-        self.Z = self.Y == 0
-        self.N = (self.Y & 0x80) != 0
+        self.Y = self.nz = val
     
         return 0
     
@@ -799,21 +952,17 @@ class cpu:
     # LSR
     def lsr_(self, unused):
         
-        self.C = (self.A & 0x01) != 0
-        self.A = (self.A >> 1)
-        self.Z = (self.A == 0)
-        self.N = (self.A & 0x80) != 0
+        self.C = self.A & 0x01
+        self.A = self.nz = self.A >> 1
         
         return 0
     
     def lsrMem_(self, addr):
         
         val = self.MEM_READ(addr)
-        self.C = (val & 0x01) != 0
-        val = val >> 1
+        self.C = val & 0x01
+        self.nz = val = val >> 1
         self.MEM_WRITE(addr, val)
-        self.Z = (val == 0)
-        self.N = (val & 0x80) != 0
         
         return 0
     
@@ -822,9 +971,7 @@ class cpu:
     
     def ora_(self, val):    
     
-        self.A = (self.A | val)
-        self.Z = (self.A == 0)
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = self.A | val
     
         return 0
     
@@ -834,6 +981,8 @@ class cpu:
     def pha_(self, val):    
     
         self.system.memory[self.SP] = self.A
+        if self.code_mask[self.SP]: # translated code overwritten
+            self._invalidate_blocks(self.SP)
         self.SP = self.SP - 1
     
         return 0    
@@ -841,6 +990,8 @@ class cpu:
     def php_(self, val):
     
         self.system.memory[self.SP] = self.PSW_GET()
+        if self.code_mask[self.SP]: # translated code overwritten
+            self._invalidate_blocks(self.SP)
         self.SP = self.SP - 1
     
         return 0    
@@ -848,9 +999,7 @@ class cpu:
     def pla_(self, val):
     
         self.SP = self.SP + 1
-        self.A  = self.system.memory[self.SP]
-        self.Z  = self.A == 0 
-        self.N  = (self.A & 0x80 != 0) 
+        self.A  = self.nz = self.system.memory[self.SP]
     
         return 0
     
@@ -866,44 +1015,36 @@ class cpu:
     def rol_(self, val):
     
         res = (self.A << 1) | self.C # Mixing integer and boolean, but it is OK (True -> 1)
-        self.A = res & 0xff
-        self.C = res > 0xff
-        self.Z = (self.A == 0)
-        self.N = (self.A & 0x80) != 0    
+        self.C = res >> 8
+        self.A = self.nz = res & 0xff
     
         return 0
     
     def rolMem_(self, addr):
     
         res = (self.MEM_READ(addr) << 1) | self.C
-        val = res & 0xff
+        self.C = res >> 8
+        self.nz = val = res & 0xff
         self.MEM_WRITE(addr, val)
-        self.C = res > 0xff
-        self.Z = (val == 0)
-        self.N = (val & 0x80) != 0    
     
         return 0
     
     # ROR
     def ror_(self, val):
         
-        bit0 = val & 0x01
-        self.A = (val >> 1) | (self.C << 7) # Mixing integer and boolean, but it is OK (True -> 1)
-        self.N = self.C
-        self.C = (bit0 != 0)
-        self.Z = (self.A == 0)
+        res = (self.A >> 1) | (self.C << 7) # Mixing integer and boolean, but it is OK (True -> 1)
+        self.C = self.A & 0x01
+        self.A = self.nz = res
         
         return 0
     
     def rorMem_(self, addr):
         
         val = self.MEM_READ(addr)
-        bit0 = val & 0x01
         res = (val >> 1) | (self.C << 7)
+        self.C = val & 0x01
+        self.nz = res
         self.MEM_WRITE(addr, res)
-        self.N = self.C
-        self.C = (bit0 != 0)
-        self.Z = (res == 0)
         
         return 0
     
@@ -942,14 +1083,14 @@ class cpu:
     # SED
     def sed_(self, unused):
     
-        self.D = 1
+        self.P |= 0x08
     
         return 0    
     
     # SEI
     def sei_(self, unused):
     
-        self.I = 1
+        self.P |= 0x04
     
         return 0
     
@@ -977,36 +1118,28 @@ class cpu:
     # TAX
     def tax_(self, unused):
     
-        self.X = self.A
-        self.Z = self.X == 0
-        self.N = (self.X & 0x80) != 0
+        self.X = self.nz = self.A
     
         return 0
     
     # TAY
     def tay_(self, unused):
     
-        self.Y = self.A
-        self.Z = self.Y == 0
-        self.N = (self.Y & 0x80) != 0
+        self.Y = self.nz = self.A
     
         return 0    
     
     # TSX
     def tsx_(self, unused):
     
-        self.X = self.SP
-        self.Z = self.X == 0
-        self.N = (self.X & 0x80) != 0
+        self.X = self.nz = self.SP
     
         return 0
     
     # TSA
     def tsa_(self, unused):
     
-        self.A = self.X
-        self.Z = self.A == 0
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = self.X
     
         return 0
     
@@ -1020,45 +1153,496 @@ class cpu:
     # TYA
     def tya_(self, unused):
     
-        self.A = self.Y
-        self.Z = self.A == 0
-        self.N = (self.A & 0x80) != 0
+        self.A = self.nz = self.Y
     
         return 0    
     
 
-    def execute(self):
+    def _build_handlers(self, predecoded=False, read=None):
+        ''' Generate one specialized handler per opcode from opcode_table.
 
-        self.page_crossed = 0
+            Addressing mode, operand fetch, PC increment, number of cycles and
+            page crossed penalty are baked into each handler, so executing an
+            instruction costs a single Python call plus the operation itself.
+            Handlers take the cpu instance as their only argument, so they are
+            generated once and shared by every cpu with the same table.
+            Call it again if opcode_table is modified.
 
-        self.mem_write = 0
-        self.mem_read = 0
+            predecoded: handlers take the operand as a second argument instead
+            of fetching it (see predecode). An extra handler at DECODE_MISS
+            falls back to the regular ones.
+            read: memory read function used for operands (default: the
+            MEM_READ of this instance, traced or not, see set_tracer)
+        '''
+        table = tuple((opFunc.__func__, opMode.__func__, nbytes, ncycles, add_page_crossed)
+                      for opFunc, opMode, nbytes, ncycles, add_page_crossed in self.opcode_table)
+        read = read or self.MEM_READ.__func__
+        handlers = cpu._handlers_cache.get((table, predecoded, read))
+        if handlers is not None:
+            return handlers
 
-        # Get the next opcode
-        print_debug("PC {}".format(hex(self.PC)))
-        opcode = self.MEM_READ(self.PC)
-#        print(hex(opcode))
-        opFunc, opMode, nbytes, ncycles, add_page_crossed = self.opcode_table[opcode]
-        
-        if opFunc == self.unknown:
-            print("Unknown opcode: {}".format(hex(opcode)))
-            import sys
-            sys.exit()
+        args = 'self, operand' if predecoded else 'self'
+        handlers = []
+        for opcode, (opFunc, opMode, nbytes, ncycles, add_page_crossed) in enumerate(table):
+            name = 'op_{:02x}'.format(opcode)
+
+            if opFunc is cpu.unknown:
+                src  = 'def {}({}):\n'.format(name, args)
+                src += '    print("Unknown opcode: {}")\n'.format(hex(opcode))
+                src += '    sys.exit()\n'
+                env  = {'sys': sys}
+                exec(src, env)
+                handlers.append(env[name])
+                continue
+
+            # Operand fetch + addressing mode
+            operand = _OPERAND_SRC[nbytes]
+            if operand is not None and predecoded:
+                operand = 'operand'
+            if operand is None:
+                mode_src, cross_src = 'addr = 0', None
+            elif opMode.__name__ in _MODE_SRC:
+                mode_src, cross_src = _MODE_SRC[opMode.__name__]
+                mode_src = mode_src.format(op=operand)
+            else:
+                mode_src  = 'self.page_crossed = 0\n'
+                mode_src += '    addr = mode(self, {})'.format(operand)
+                cross_src = 'self.page_crossed'
+            mode_src = mode_src.replace('read(', 'read(self, ')
+
+            src  = 'def {}({}, read=read, mode=mode, op=op):\n'.format(name, args)
+            src += '    pc = self.PC\n'
+            src += '    {}\n'.format(mode_src)
+            src += '    self.PC = pc + {}\n'.format(nbytes)
+            src += '    cycles = {}\n'.format(ncycles)
+            if add_page_crossed and cross_src is not None:
+                src += '    if {}: cycles += 1\n'.format(cross_src)
+            if opFunc.__name__ in cpu._BRANCH_OPS:
+                src += '    cycles += op(self, addr)\n'
+                src += '    self.system.clk_cycles += cycles * 3\n'
+            else:
+                # Clock updated first: device writes are timestamped at the
+                # end of the instruction
+                src += '    self.system.clk_cycles += cycles * 3\n'
+                src += '    op(self, addr)\n'
+            src += '    return cycles\n'
+
+            env = {'read': read, 'mode': opMode, 'op': opFunc}
+            exec(src, env)
+            handlers.append(env[name])
+
+        if predecoded:
+            def op_miss(self, operand, read=read, handlers=self._build_handlers(read=read)):
+                return handlers[read(self, self.PC)](self)
+            handlers.append(op_miss)
+
+        if read is cpu.MEM_READ: # traced handlers are not shared
+            cpu._handlers_cache[(table, predecoded, read)] = handlers
+        return handlers
+
+    def save_state(self):
+        ''' Registers and flags, packed (see STATE). Memory belongs to System,
+            and the pending device writes are empty between steps
+        '''
+        return cpu.STATE.pack(self.A, self.X, self.Y, self.PC, self.SP,
+                              self.P, self.C, self.nz, self.page_crossed)
+
+    def load_state(self, state):
+        ''' Restore the registers saved by save_state '''
+        (self.A, self.X, self.Y, self.PC, self.SP,
+         self.P, self.C, self.nz, self.page_crossed) = cpu.STATE.unpack(state)
+        del self.events[:]
+        self.TIA_UPDATE = self.RIOT_UPDATE = False
+
+    def clone(self, system):
+        ''' Copy of this cpu on another System, same registers and same
+            predecoded ROM and translated blocks (valid as long as the memory
+            is copied too). Handlers are shared (they take the cpu as an
+            argument, see _build_handlers), the opcode table is bound to the
+            copy. Devices are not wired, and the copy is untraced and untimed
+        '''
+        other = cpu.__new__(cpu)
+        # Without the methods installed on this instance (tracer, timing)
+        other.__dict__.update((name, value) for name, value in self.__dict__.items() if not callable(value))
+        other.system       = system
+        other.events       = []
+        other.tia          = None
+        other.riot         = None
+        other.blocks       = dict(self.blocks)
+        other.block_ranges = dict(self.block_ranges)
+        other.code_mask    = bytearray(self.code_mask)
+        other.rom_decoded  = array('I', self.rom_decoded)
+        other.opcode_table = [[getattr(other, opFunc.__name__), getattr(other, opMode.__name__), nbytes, ncycles, add_page_crossed]
+                              for opFunc, opMode, nbytes, ncycles, add_page_crossed in self.opcode_table]
+        if self.tracer is not None:
+            other.set_tracer(None)
+        return other
+
+    def set_tracer(self, tracer):
+        ''' Attach a tracing.Tracer to this cpu (None detaches it).
+
+            Instrumented handlers and bus operations are installed on this
+            instance only, as required by the tracer levels. Without a tracer
+            the plain code runs, so tracing costs nothing when disabled.
+            Instruction and bus read tracing disable block translation
+            (until the tracer is detached).
+        '''
+        if self.tracer is None:
+            self.untraced_translate = self.translate
+        self.__dict__.pop('MEM_READ', None)
+        self.__dict__.pop('MEM_WRITE', None)
+        self.tracer = tracer
+        self.translate = self.untraced_translate
+        if self.tia is not None:
+            self.tia.set_tracer(tracer)
+        if tracer is None:
+            self.handlers     = self._build_handlers()
+            self.rom_handlers = self._build_handlers(predecoded=True)
+            return
+
+        record = tracer.record
+        bus    = tracer.level(tracing.BUS)
+        tia    = tracer.level(tracing.TIA)
+        riot   = tracer.level(tracing.RIOT)
+
+        # Bus reads (operand fetches included)
+        read = cpu.MEM_READ
+        if bus >= 2 or riot >= 2:
+            def traced_read(self, addr, read=cpu.MEM_READ):
+                value = read(self, addr)
+                addr &= cpu.MAX_MEM_ADDR
+                if bus >= 2:
+                    record(tracing.BUS, tracing.EV_READ, addr, value, self.system.clk_cycles)
+                if riot >= 2 and self.write_dev[addr] == BUS_RIOT:
+                    record(tracing.RIOT, tracing.EV_READ, self.read_map[addr], value, self.system.clk_cycles)
+                return value
+            read = traced_read
+            self.MEM_READ = types.MethodType(traced_read, self)
+
+        # Bus writes
+        if bus or tia or riot:
+            def traced_write(addr, value, write=cpu.MEM_WRITE):
+                clk = self.system.clk_cycles
+                write(self, addr, value)
+                addr &= cpu.MAX_MEM_ADDR
+                dev  = self.write_dev[addr]
+                if bus:
+                    record(tracing.BUS, tracing.EV_WRITE, addr, value, clk)
+                if tia and (dev == BUS_TIA or dev == BUS_TIA_SYNC):
+                    record(tracing.TIA, tracing.EV_WRITE, self.write_map[addr], value, clk)
+                elif riot and dev == BUS_RIOT:
+                    record(tracing.RIOT, tracing.EV_WRITE, self.write_map[addr], value, clk)
+            self.MEM_WRITE = traced_write
+
+        handlers     = self._build_handlers(read=read)
+        rom_handlers = self._build_handlers(predecoded=True, read=read)
+        if read is not cpu.MEM_READ:
+            # Fetch ROM instructions from memory, so that they are traced too
+            rom_handlers = [rom_handlers[cpu.DECODE_MISS]] * len(rom_handlers)
+            self.translate = False
+
+        # Executed instructions
+        if tracer.level(tracing.CPU):
+            self.translate = False
+            def traced(handler, opcode):
+                def op(self):
+                    record(tracing.CPU, tracing.EV_INSTR, self.PC, opcode, self.system.clk_cycles)
+                    return handler(self)
+                return op
+            def traced_rom(handler, opcode):
+                def op(self, operand):
+                    pc = self.PC
+                    record(tracing.CPU, tracing.EV_INSTR, pc,
+                           opcode if opcode != cpu.DECODE_MISS else
+                           self.system.memory[self.read_map[pc & cpu.MAX_MEM_ADDR]],
+                           self.system.clk_cycles)
+                    return handler(self, operand)
+                return op
+            handlers     = [traced(h, opcode) for opcode, h in enumerate(handlers)]
+            rom_handlers = [traced_rom(h, opcode) for opcode, h in enumerate(rom_handlers)]
+
+        self.handlers     = handlers
+        self.rom_handlers = rom_handlers
+
+    def predecode(self, first=0, last=ROM_SIZE):
+        ''' Decode the cartridge ROM instructions once, so that executing from
+            ROM does not fetch and mask the opcode and operand bytes again.
+
+            Each rom_decoded entry (indexed by ROM offset) packs:
+              bits 0-8:   opcode (DECODE_MISS if it must be fetched from memory)
+              bits 9-11:  instruction length
+              bits 12-27: operand
+            Call it after loading the ROM and after every bank switch.
+            first/last (ROM offsets) limit the range to be decoded again.
+        '''
+        memory  = self.system.memory
+        table   = self.opcode_table
+        decoded = self.rom_decoded
+        first, last = max(first, 0), min(last, cpu.ROM_SIZE)
+        for offset in range(first, last):
+            addr   = cpu.ROM_ADDR + offset
+            opcode = memory[addr]
+            nbytes = table[opcode][2]
+            if offset + nbytes > cpu.ROM_SIZE:
+                # Operand wraps around the end of the ROM
+                decoded[offset] = cpu.DECODE_MISS
+                continue
+            if nbytes == 2  : operand = memory[addr + 1]
+            elif nbytes == 3: operand = memory[addr + 1] | (memory[addr + 2] << 8)
+            else            : operand = 0
+            decoded[offset] = opcode | (nbytes << 9) | (operand << 12)
+
+        # Translated blocks may be stale too (bank switch)
+        if first == 0 and last == cpu.ROM_SIZE:
+            self._invalidate_blocks(cpu.ROM_ADDR, cpu.ROM_ADDR + cpu.ROM_SIZE)
+
+    def _translate_block(self, pc):
+        ''' Translate the straight-line run of instructions starting at pc into a
+            single Python function.
 
-        # Get the operand (if appropriate)
-        if nbytes == 2  : addr = opMode(self.MEM_READ(self.PC+1))
-        elif nbytes == 3: addr = opMode(self.MEM_READ(self.PC+1) + (self.MEM_READ(self.PC+2)<<8))
-        else            : addr = 0
+            The block ends after the first instruction changing the program flow
+            (branch, JMP, JSR, RTS, RTI, BRK), writing to a device register
+            (TIA/RIOT, or any address not known at translation time) or reading
+            the RIOT timer, so the caller can service it exactly as after
+            execute().
+        '''
+        # Polling loops are run by a fast-forwarding block instead
+        loop = self._idle_loop(pc)
+        if loop is not None:
+            end, timer = loop
+            return self._register_block(pc, end, self._idle_block(pc, end, timer))
 
-        # Update PC
-        self.PC += nbytes
+        body   = []
+        env    = {'read': cpu.MEM_READ}
+        cycles = 0
+        addr   = pc
+        ninstr = 0
+        while ninstr < cpu.MAX_BLOCK_LEN:
+            opFunc, opMode, nbytes, ncycles, add_page_crossed = self.opcode_table[self.MEM_READ(addr)]
+            if opFunc == self.unknown:
+                break # let execute() report it
 
-        # Execute opcode
-        extra_cycles  = opFunc(addr)
-        extra_cycles += add_page_crossed * self.page_crossed
+            if nbytes == 2  : operand = self.MEM_READ(addr+1)
+            elif nbytes == 3: operand = self.MEM_READ(addr+1) + (self.MEM_READ(addr+2)<<8)
+            else            : operand = None
 
-        # Update num cycles
-        self.system.clk_cycles = self.system.clk_cycles + (ncycles + extra_cycles) * 3
+            # Operand address/value
+            name  = opMode.__name__
+            cross = None
+            if operand is None:
+                mode_src = 'addr = 0'
+            elif name in cpu._STATIC_MODES:
+                mode_src = 'addr = {}'.format(opMode(operand))
+            elif name in _MODE_SRC:
+                mode_src, cross = _MODE_SRC[name]
+                mode_src = mode_src.format(op=operand).replace('read(', 'read(self, ')
+            else:
+                env['m{}'.format(ninstr)] = opMode.__func__
+                mode_src  = 'self.page_crossed = 0\n'
+                mode_src += '    addr = m{}(self, {})'.format(ninstr, operand)
+                cross = 'self.page_crossed'
 
-        return (ncycles + extra_cycles)
+            addr  += nbytes
+            ninstr += 1
+            cycles += ncycles
+
+            op   = opFunc.__name__
+            # Device behind a static operand address (RIOT timer reads depend on
+            # the clock, so they also end the block)
+            dev  = None
+            if operand is not None and name in ('MEM_READ_ZEROPAGE', 'MEM_READ_ABSOLUTE'):
+                dev = self.write_dev[opMode(operand) & cpu.MAX_MEM_ADDR]
+            sync = (op in cpu._STORE_OPS and (dev is None or dev != BUS_RAM)) or dev == BUS_RIOT
+            last = op in cpu._FLOW_OPS or ninstr == cpu.MAX_BLOCK_LEN or sync
+
+            env['f{}'.format(ninstr)] = opFunc.__func__
+            body.append('    # {}: {} {}'.format(hex(addr - nbytes), op, name))
+            body.append('    {}'.format(mode_src))
+            if add_page_crossed and cross is not None:
+                body.append('    if {}: cycles += 1'.format(cross))
+            if last:
+                body.append('    self.PC = {}'.format(addr))
+            if op in cpu._BRANCH_OPS:
+                body.append('    cycles += f{}(self, addr)'.format(ninstr))
+            elif sync:
+                # Device accesses are timestamped at the end of the instruction
+                body.append('    self.system.clk_cycles += cycles * 3')
+                body.append('    f{}(self, addr)'.format(ninstr))
+                body.append('    return cycles')
+            else:
+                body.append('    f{}(self, addr)'.format(ninstr))
+            if last:
+                break
+
+        if ninstr == 0:
+            return None
+        if not last:
+            body.append('    self.PC = {}'.format(addr))
+
+        name = 'block_{:04x}'.format(pc)
+        src  = 'def {}(self, {}):\n'.format(name, ', '.join('{0}={0}'.format(k) for k in env))
+        src += '    cycles = {}\n'.format(cycles)
+        src += '\n'.join(body) + '\n'
+        if not body[-1].endswith('return cycles'):
+            src += '    self.system.clk_cycles += cycles * 3\n'
+            src += '    return cycles\n'
+        exec(src, env)
+
+        return self._register_block(pc, addr, env[name])
+
+    def _register_block(self, pc, end, block):
+        ''' Register the block covering [pc, end), so that writing into its
+            code invalidates it. Ranges are physical addresses (see the read
+            map), the ones written by MEM_WRITE: code may run from a mirror
+        '''
+        code  = [self.read_map[addr & cpu.MAX_MEM_ADDR] for addr in range(pc, end)]
+        first, last = min(code), max(code) + 1
+        self.blocks[pc] = block
+        self.block_ranges[pc] = (first, last)
+        self.code_mask[first:last] = b'\x01' * (last - first)
+
+        return block
+
+    def _idle_loop(self, pc):
+        ''' Detect a polling loop starting at pc, i.e.:
+                loop: LDA INTIM
+                      BNE loop
+            A short straight-line run of loads, compares and tests (see
+            _POLL_OPS) with static operand addresses, ending with a branch
+            back to pc and reading the RIOT timer (INTIM/TIMINT) or a TIA read
+            register. Such a loop only depends on what it reads: RAM/ROM (not
+            written), TIA read registers (fixed until the end of the scanline)
+            and the RIOT timer. Countdown loops (i.e.: DEX, BNE) change the
+            registers on every iteration: they are translated as usual.
+            Returns (loop end address, True if the RIOT timer is read) or None
+        '''
+        addr   = pc
+        timer  = False
+        polled = False
+        for n in range(cpu.MAX_IDLE_LEN):
+            opFunc, opMode, nbytes, ncycles, add_page_crossed = self.opcode_table[self.MEM_READ(addr)]
+            op   = opFunc.__name__
+            name = opMode.__name__
+            if op in cpu._BRANCH_OPS:
+                addr += nbytes
+                return (addr, timer) if polled and addr + opMode(self.MEM_READ(addr - 1)) == pc else None
+            if op not in cpu._POLL_OPS or name not in cpu._STATIC_MODES:
+                return None
+
+            if nbytes == 2  : operand = self.MEM_READ(addr+1)
+            elif nbytes == 3: operand = self.MEM_READ(addr+1) + (self.MEM_READ(addr+2)<<8)
+            else            : operand = None
+            addr += nbytes
+
+            if operand is not None and name in ('MEM_READ_ZEROPAGE', 'MEM_READ_ABSOLUTE'):
+                reg = self.read_map[opMode(operand) & cpu.MAX_MEM_ADDR]
+                if reg in (0x284, 0x285): # RIOT INTIM/TIMINT
+                    timer = polled = True
+                elif 0x100 <= reg < 0x110: # TIA read registers (relocated)
+                    polled = True
+
+        return None
+
+    def _idle_block(self, pc, end, timer):
+        ''' Block running the polling loop at [pc, end) (see _idle_loop).
+
+            Each call runs one iteration. Once an iteration leaves the registers
+            unchanged, the following ones are identical until what the loop
+            reads changes: the RIOT timer (if read) or the TIA read registers
+            (at the end of the scanline). All those iterations are skipped at
+            once, just advancing the clock.
+        '''
+        def idle_block(self):
+            state  = (self.A, self.X, self.Y, self.SP, self.P, self.C, self.nz)
+            cycles = 0
+            while True:
+                cycles += self.execute()
+                if self.PC == pc or not (pc < self.PC < end):
+                    break
+            if self.PC != pc or state != (self.A, self.X, self.Y, self.SP, self.P, self.C, self.nz):
+                return cycles
+
+            # Cycles left until the end of the scanline (or the next timer
+            # change since this iteration started)
+            system  = self.system
+            horizon = (228 - system.clk_cycles + 2) // 3
+            if timer:
+                now = self.riot.cycles(system.clk_cycles)
+                horizon = min(horizon, self.riot.next_change(now - cycles) - now)
+            skip = (horizon - 1) // cycles
+            if skip > 0:
+                system.clk_cycles += skip * cycles * 3
+                cycles += skip * cycles
+
+            return cycles
+
+        return idle_block
+
+    def _invalidate_blocks(self, addr, end=None):
+        ''' Drop every translated block covering physical address addr
+            (or any address in [addr, end))
+        '''
+        if end is None:
+            end = addr + 1
+        for pc, (first, last) in list(self.block_ranges.items()):
+            if first < end and addr < last:
+                del self.blocks[pc]
+                del self.block_ranges[pc]
+        self.code_mask[:] = bytes(len(self.code_mask))
+        for first, last in self.block_ranges.values():
+            self.code_mask[first:last] = b'\x01' * (last - first)
+
+    def execute(self):
+
+        self.mem_write = 0
+        self.mem_read = 0
+
+        # Dispatch to its fused handler (it returns the number of cycles)
+        pc = self.PC
+        if pc & 0x1000: # ROM: predecoded instruction
+            entry = self.rom_decoded[pc & 0xfff]
+            return self.rom_handlers[entry & 0x1ff](self, entry >> 12)
+        return self.handlers[self.MEM_READ(pc)](self)
+
+    def run(self, budget):
+        ''' Run instructions until 'budget' CPU cycles are consumed or a device
+            needs service: a TIA sync register write (WSYNC, RSYNC, CXCLR), a
+            RIOT write or the end of the scanline. Other TIA writes do not stop
+            the CPU, they are just queued in cpu.events.
+            Returns (cycles consumed, stop reason), see cpu.STOP_xxx.
+        '''
+        system = self.system
+        cycles = 0
+
+        if self.translate:
+            blocks = self.blocks
+            while cycles < budget:
+                block = blocks.get(self.PC)
+                if block is None:
+                    block = self._translate_block(self.PC) or cpu.execute
+                cycles += block(self)
+                if self.TIA_UPDATE:
+                    return cycles, cpu.STOP_TIA
+                if self.RIOT_UPDATE:
+                    return cycles, cpu.STOP_RIOT
+                if system.clk_cycles >= 228:
+                    return cycles, cpu.STOP_LINE
+        else:
+            handlers = self.handlers
+            rom_handlers, rom_decoded = self.rom_handlers, self.rom_decoded
+            read = self.MEM_READ # Traced or not (see set_tracer)
+            while cycles < budget:
+                pc = self.PC
+                if pc & 0x1000:
+                    entry = rom_decoded[pc & 0xfff]
+                    cycles += rom_handlers[entry & 0x1ff](self, entry >> 12)
+                else:
+                    cycles += handlers[read(pc)](self)
+                if self.TIA_UPDATE:
+                    return cycles, cpu.STOP_TIA
+                if self.RIOT_UPDATE:
+                    return cycles, cpu.STOP_RIOT
+                if system.clk_cycles >= 228:
+                    return cycles, cpu.STOP_LINE
 
+        return cycles, cpu.STOP_BUDGET
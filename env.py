@@ -0,0 +1,143 @@
+#
+# Gym-style environment
+#
+# Atari2600 console driven by a discrete joystick (player 0) action set:
+#
+#   env = AtariEnv("prueba.bin", obs_type="ram", repeat=4)
+#   obs = env.reset()
+#   obs, reward, done, info = env.step(AtariEnv.UPFIRE)
+#
+# The console is headless (no video output). Intermediate frames of an action
+# repeat are not rendered at all (TIA frameskip), only the last one when the
+# observation is the framebuffer.
+#
+# Observations are NumPy views on the emulator buffers (no copies), so they are
+# overwritten by the next step/reset. Copy them if they must be kept:
+# - "ram":    RIOT RAM, (128,) uint8
+# - "screen": TIA framebuffer, (212, 160) uint8 palette indices (see TIA.palette)
+#
+# The emulator knows nothing about the game being played: reward and episode end
+# come from user functions of the console state, i.e.:
+#   reward_fn = lambda atari: atari.system.ram[0x00]   # score at 0x80
+#
+import numpy as np
+from atari2600 import Atari2600
+
+class AtariEnv:
+
+    #
+    # Actions (same order as the Arcade Learning Environment)
+    #
+    NOOP          = 0
+    FIRE          = 1
+    UP            = 2
+    RIGHT         = 3
+    LEFT          = 4
+    DOWN          = 5
+    UPRIGHT       = 6
+    UPLEFT        = 7
+    DOWNRIGHT     = 8
+    DOWNLEFT      = 9
+    UPFIRE        = 10
+    RIGHTFIRE     = 11
+    LEFTFIRE      = 12
+    DOWNFIRE      = 13
+    UPRIGHTFIRE   = 14
+    UPLEFTFIRE    = 15
+    DOWNRIGHTFIRE = 16
+    DOWNLEFTFIRE  = 17
+
+    ACTION_NAMES = ["NOOP", "FIRE", "UP", "RIGHT", "LEFT", "DOWN",
+                    "UPRIGHT", "UPLEFT", "DOWNRIGHT", "DOWNLEFT",
+                    "UPFIRE", "RIGHTFIRE", "LEFTFIRE", "DOWNFIRE",
+                    "UPRIGHTFIRE", "UPLEFTFIRE", "DOWNRIGHTFIRE", "DOWNLEFTFIRE"]
+
+    #
+    # Input registers (physical addresses, see the memory map in atari2600.py)
+    #
+    SWCHA = 0x280 #  xxxx xxxx   Joysticks (P0: high nibble), active low
+    INPT4 = 0x10C #  x000 0000   P0 trigger, active low
+
+    # SWCHA P0 bits
+    P0_RIGHT = 0x80
+    P0_LEFT  = 0x40
+    P0_DOWN  = 0x20
+    P0_UP    = 0x10
+
+    # Action -> (SWCHA, INPT4) register values
+    ACTION_INPUTS = []
+    for _name in ACTION_NAMES:
+        _swcha = 0xff
+        for _dir, _bit in (("UP", P0_UP), ("RIGHT", P0_RIGHT), ("LEFT", P0_LEFT), ("DOWN", P0_DOWN)):
+            if _dir in _name:
+                _swcha &= ~_bit
+        ACTION_INPUTS.append((_swcha, 0x00 if "FIRE" in _name else 0x80))
+    del _name, _swcha, _dir, _bit
+
+    OBS_TYPES  = ("ram", "screen")
+    OBS_SHAPES = {"ram": (128,), "screen": (192+20, 160)} # See System.ram, TIA.screen
+
+    def __init__(self, rom, obs_type="ram", repeat=1, max_frames=None, reward_fn=None, done_fn=None):
+        ''' rom:        cartridge image (bytes) or path to it
+            obs_type:   "ram" or "screen"
+            repeat:     frames each action is held for
+            max_frames: episode length limit (frames), None: no limit
+            reward_fn:  reward_fn(atari) -> reward after each step. Default: 0
+            done_fn:    done_fn(atari) -> True at the end of the episode
+        '''
+        if obs_type not in AtariEnv.OBS_TYPES:
+            raise ValueError("obs_type must be one of {}".format(AtariEnv.OBS_TYPES))
+        if repeat < 1:
+            raise ValueError("repeat must be >= 1")
+
+        self.obs_type   = obs_type
+        self.repeat     = repeat
+        self.max_frames = max_frames
+        self.reward_fn  = reward_fn
+        self.done_fn    = done_fn
+
+        self.n_actions = len(AtariEnv.ACTION_NAMES)
+
+        # Headless, and no frame rendered unless requested (see step)
+        self.atari = Atari2600(rom, frameskip=0)
+        self._bind()
+
+    def _bind(self):
+        ''' Views on the current console buffers (reset recreates them) '''
+        system = self.atari.system
+        self.memory = system.memory
+        if self.obs_type == "ram":
+            self.obs = np.frombuffer(system.ram, np.uint8)
+        else:
+            self.obs = self.atari.tia.screen
+
+    def reset(self):
+        ''' Power-on the console. Returns the first observation '''
+        self.atari.reset()
+        self._bind()
+        return self.obs
+
+    def step(self, action):
+        ''' Hold 'action' for 'repeat' frames.
+            Returns (obs, reward, done, info)
+        '''
+        atari = self.atari
+        memory = self.memory
+
+        memory[AtariEnv.SWCHA], memory[AtariEnv.INPT4] = AtariEnv.ACTION_INPUTS[action]
+
+        ok = True
+        for i in range(self.repeat):
+            if self.obs_type == "screen" and i == self.repeat - 1:
+                atari.tia.request_frame()
+            if not atari.step_frame():
+                ok = False # No VSYNC: the episode cannot go on
+                break
+
+        reward = self.reward_fn(atari) if self.reward_fn is not None else 0
+        done = (not ok
+                or (self.max_frames is not None and atari.frame_cnt >= self.max_frames)
+                or (self.done_fn is not None and bool(self.done_fn(atari))))
+        info = {"frame": atari.frame_cnt}
+
+        return self.obs, reward, done, info
@@ -0,0 +1,101 @@
+#
+# RIOT (PIA 6532)
+#
+# Only the interval timer is emulated here (RAM and I/O ports are plain memory).
+#
+# The timer is not clocked: writing TIM1T/TIM8T/TIM64T/T1024T just records the
+# start value, the prescaler and the CPU cycle of the write, and INTIM/TIMINT are
+# computed from the current CPU cycle when the CPU reads them. Assume:
+# - The first decrement happens one cycle after the write, then once every
+#   'prescaler' cycles
+# - After reaching 0, the timer underflows to 0xFF, sets the interrupt flag and
+#   keeps decrementing once per cycle until it is written again
+# - Reading INTIM clears the interrupt flag
+#
+
+import struct
+
+class RIOT:
+
+    #
+    # Registers (physical addresses, see the memory map in atari2600.py)
+    #
+    # Read
+    INTIM  = 0x284 #  xxxx xxxx   Timer output
+    TIMINT = 0x285 #  x000 0000   Timer interrupt flag
+    # Write
+    TIM1T  = 0x294 #  xxxx xxxx   Set 1 clock interval
+    TIM8T  = 0x295 #  xxxx xxxx   Set 8 clock interval
+    TIM64T = 0x296 #  xxxx xxxx   Set 64 clock interval
+    T1024T = 0x297 #  xxxx xxxx   Set 1024 clock interval
+
+    PRESCALERS = [1, 8, 64, 1024] # TIM1T, TIM8T, TIM64T, T1024T
+
+    # Timer state (see save_state): timer_value, prescaler, timer_start, flag_read
+    STATE = struct.Struct('<iiq?')
+
+    def __init__(self, system):
+
+        self.system = system
+
+        # Timer state at the last TIMxT write
+        self.timer_value = 0
+        self.prescaler   = 1024
+        self.timer_start = 0       # CPU cycle of the write
+        self.flag_read   = False   # Interrupt flag cleared by an INTIM read
+
+    def cycles(self, clk):
+        ''' Absolute CPU cycle for color clock 'clk' of the current scanline '''
+        return self.system.line_start + clk // 3
+
+    def timer(self, now):
+        ''' Timer value and underflow state at CPU cycle 'now' '''
+        elapsed = now - self.timer_start
+        if elapsed <= 0:
+            return self.timer_value, False
+        ticks = (elapsed - 1) // self.prescaler + 1
+        if ticks <= self.timer_value:
+            return self.timer_value - ticks, False
+        # Underflow: one decrement per cycle from then on
+        underflow = self.timer_value * self.prescaler + 1
+        return (0xff - (elapsed - underflow)) & 0xff, True
+
+    def next_change(self, now):
+        ''' CPU cycle of the first timer change after CPU cycle 'now' '''
+        elapsed = now - self.timer_start
+        if elapsed <= 0:
+            return self.timer_start + 1
+        ticks = (elapsed - 1) // self.prescaler + 1
+        if ticks <= self.timer_value:
+            return self.timer_start + 1 + ticks * self.prescaler
+        return now + 1
+
+    def save_state(self):
+        ''' Timer state, packed (see STATE) '''
+        return RIOT.STATE.pack(self.timer_value, self.prescaler, self.timer_start, self.flag_read)
+
+    def load_state(self, state):
+        ''' Restore the timer state saved by save_state '''
+        self.timer_value, self.prescaler, self.timer_start, self.flag_read = RIOT.STATE.unpack(state)
+
+    def write(self, addr, value, clk):
+        ''' RIOT register write operation (queued by the CPU, see cpu.events).
+            Timer registers are decoded by A4 and A2 (A3, interrupt enable, is
+            ignored), so 0x29C-0x29F mirror 0x294-0x297
+        '''
+        if addr & 0x14 == 0x14:
+            self.timer_value = value
+            self.prescaler   = RIOT.PRESCALERS[addr & 0x03]
+            self.timer_start = self.cycles(clk)
+            self.flag_read   = False
+        # I/O ports (SWCHA, SWACNT, ...): the value is already in memory (see
+        # cpu.MEM_WRITE), traced at riot level 1 (see cpu.set_tracer)
+
+    def read(self, addr):
+        ''' Timer registers read (INTIM/TIMINT), at the current CPU cycle '''
+        value, underflow = self.timer(self.cycles(self.system.clk_cycles))
+        if addr == RIOT.INTIM:
+            if underflow:
+                self.flag_read = True
+            return value
+        return 0x80 if underflow and not self.flag_read else 0x00
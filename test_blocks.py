@@ -0,0 +1,76 @@
+#
+# Translated blocks
+#
+from atari2600 import Atari2600
+
+def cartridge(code):
+    rom = bytearray(0x1000)
+    rom[:len(code)] = code
+    rom[0xffc:0xffe] = bytes([0x00, 0xf0]) # Reset vector: F000
+    return bytes(rom)
+
+def run(rom, steps=3000):
+    atari = Atari2600(rom)
+    for i in range(steps):
+        atari.step()
+    return atari
+
+def test_idle_loops():
+    countdown = cartridge(bytes([
+        0xa2, 0x00,       # F000 start: LDX #0
+        0xca,             # F002 loop:  DEX
+        0xd0, 0xfd,       # F003        BNE loop
+        0x4c, 0x00, 0xf0, # F005        JMP start
+    ]))
+    polling = cartridge(bytes([
+        0xad, 0x84, 0x02, # F000 start: LDA INTIM
+        0xd0, 0xfb,       # F003        BNE start
+        0xa9, 0x40,       # F005        LDA #$40
+        0x8d, 0x96, 0x02, # F007        STA TIM64T
+        0x4c, 0x00, 0xf0, # F00A        JMP start
+    ]))
+    # Countdown loops change the registers: translated as usual
+    atari = run(countdown)
+    assert atari.cpu.blocks[0xf002].__name__ != 'idle_block'
+    atari = run(polling)
+    assert atari.cpu.blocks[0xf000].__name__ == 'idle_block'
+
+def test_self_modifying_code_in_ram():
+    mirror = cartridge(bytes([
+        0xa9, 0xa9,       # F000        LDA #$A9     RAM $80: LDA #0
+        0x85, 0x80,       # F002        STA $80
+        0xa9, 0x00,       # F004        LDA #0
+        0x85, 0x81,       # F006        STA $81
+        0xa9, 0x60,       # F008        LDA #$60     RAM $82: RTS
+        0x85, 0x82,       # F00A        STA $82
+        0xa2, 0xff,       # F00C        LDX #$FF
+        0x9a,             # F00E        TXS
+        0x20, 0x80, 0x01, # F00F loop:  JSR $0180    RAM code, through a mirror
+        0x85, 0x90,       # F012        STA $90
+        0xe6, 0x81,       # F014        INC $81      LDA operand
+        0x4c, 0x0f, 0xf0, # F016        JMP loop
+    ]))
+    stack = cartridge(bytes([
+        0xa9, 0xa9,       # F000        LDA #$A9     RAM $F0: LDA #$F1
+        0x85, 0xf0,       # F002        STA $F0
+        0xa9, 0x4c,       # F004        LDA #$4C     RAM $F2: JMP back
+        0x85, 0xf2,       # F006        STA $F2
+        0xa9, 0x15,       # F008        LDA #<back
+        0x85, 0xf3,       # F00A        STA $F3
+        0xa9, 0xf0,       # F00C        LDA #>back
+        0x85, 0xf4,       # F00E        STA $F4
+        0xe6, 0x80,       # F010 loop:  INC $80
+        0x4c, 0x1a, 0xf0, # F012        JMP push
+        0x85, 0x90,       # F015 back:  STA $90
+        0x4c, 0x10, 0xf0, # F017        JMP loop
+        0xa5, 0x80,       # F01A push:  LDA $80
+        0xa2, 0xf1,       # F01C        LDX #$F1
+        0x9a,             # F01E        TXS
+        0x48,             # F01F        PHA          LDA operand
+        0x4c, 0xf0, 0x00, # F020        JMP $00F0
+    ]))
+    # Last value loaded by the RAM code: the current operand, or the previous
+    # one (if stopped in the middle of the loop)
+    for rom, operand in ((mirror, 0x81), (stack, 0x80)):
+        memory = run(rom).system.memory
+        assert memory[0x90] > 1 and memory[0x90] in (memory[operand], (memory[operand] - 1) & 0xff)
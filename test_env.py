@@ -0,0 +1,35 @@
+#
+# AtariEnv observations against a console rendering every frame
+#
+import numpy as np
+
+from atari2600 import Atari2600
+from env import AtariEnv
+
+def reference_screens(rom, frames):
+    ''' Framebuffer at the end of each frame (1..frames), every frame rendered '''
+    atari = Atari2600(rom)
+    screens = []
+    for i in range(frames):
+        atari.step_frame()
+        screens.append(atari.tia.screen.copy())
+    return screens
+
+def test_screen_obs_is_last_frame_of_repeat(rom):
+    for repeat in (1, 2, 4):
+        env = AtariEnv(rom, obs_type="screen", repeat=repeat)
+        env.reset()
+        screens = reference_screens(rom, 4 * repeat)
+        for i in range(4):
+            obs, reward, done, info = env.step(AtariEnv.NOOP)
+            assert info["frame"] == (i + 1) * repeat
+            assert np.array_equal(obs, screens[info["frame"] - 1]), (repeat, info)
+        assert len(np.unique(screens[-1])) > 1 # Frames are not blank
+
+def test_ram_obs_is_a_view(rom):
+    env = AtariEnv(rom, obs_type="ram", repeat=2)
+    obs = env.reset()
+    obs2, _, _, info = env.step(AtariEnv.FIRE)
+    # Frame counter at $80 (the power-on VSYNC ends an empty frame)
+    assert obs2 is obs and obs[0] == info["frame"] - 1
+    assert env.memory[AtariEnv.INPT4] == 0x00
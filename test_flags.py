@@ -0,0 +1,87 @@
+#
+# Status flags: lazy N/Z and packed P (see cpu.PSW_GET) against a reference
+# model with one boolean per flag (the implementation before the rewrite).
+# Instructions are executed from RAM through the regular dispatch (cpu.execute)
+#
+import random
+
+from atari2600 import System
+from cpu import cpu
+
+SEED   = 2600
+ROUNDS = 2000
+
+CODE = 0x80 # Instructions are placed at the start of RAM
+DATA = 0xc0 # Memory operand (zero page)
+
+def make_cpu():
+    c = cpu(System())
+    c.SP = 0xff
+    return c
+
+def run(c, code, A, C, data=0):
+    ''' Execute the instruction 'code' (bytes) with registers A and C '''
+    c.system.memory[CODE:CODE + len(code)] = bytes(code)
+    c.system.memory[DATA] = data
+    c.A, c.C, c.PC = A, C, CODE
+    c.execute()
+
+def flags(c):
+    return c.N, c.V, c.Z, bool(c.C)
+
+#
+# Reference model
+#
+def ref_adc(A, val, C, V):
+    res = A + val + C
+    C = res > 255
+    res &= 0xff
+    V = (A^res)&(val^res)&0x80 != 0
+    return res, (res & 0x80 != 0, V, res == 0, C)
+
+def ref_sbc(A, val, C, V):
+    return ref_adc(A, val ^ 0xff, C, V)
+
+def ref_cmp(A, val, C, V):
+    return A, ((A - val) & 0x80 != 0, V, A == val, A >= val)
+
+def ref_bit(A, val, C, V):
+    return A, (val & 0x80 != 0, val & 0x40 != 0, val & A == 0, bool(C))
+
+def check(opcodes, ref):
+    rnd = random.Random(SEED)
+    c = make_cpu()
+    for i in range(ROUNDS):
+        A, val, C, V = rnd.randrange(256), rnd.randrange(256), rnd.randrange(2), rnd.randrange(2)
+        for code in opcodes(val):
+            c.V = V
+            run(c, code, A, C, data=val)
+            A_ref, flags_ref = ref(A, val, C, bool(V))
+            assert (c.A, flags(c)) == (A_ref, flags_ref), (code, A, val, C, V)
+
+def test_adc():
+    check(lambda val: ([0x69, val], [0x65, DATA]), ref_adc)
+
+def test_sbc():
+    check(lambda val: ([0xe9, val], [0xe5, DATA]), ref_sbc)
+
+def test_cmp():
+    check(lambda val: ([0xc9, val], [0xc5, DATA]), ref_cmp)
+
+def test_bit():
+    check(lambda val: ([0x24, DATA],), ref_bit)
+
+def test_php_plp():
+    ''' PLP then PHP: every flag round-trips through P, C and nz (bit 5 is
+        always set)
+    '''
+    c = make_cpu()
+    for psw in range(256):
+        c.system.memory[0xff] = psw
+        c.SP = 0xfe
+        run(c, [0x28], c.A, c.C)                # PLP
+        N, V, Z, C = flags(c)
+        assert (N, V, Z, C) == (psw & 0x80 != 0, psw & 0x40 != 0, psw & 0x02 != 0, psw & 0x01 != 0)
+        assert (c.B, c.D, c.I) == (psw & 0x10 != 0, psw & 0x08 != 0, psw & 0x04 != 0)
+        run(c, [0x08], c.A, c.C)                # PHP
+        assert c.system.memory[0xff] == psw | 0x20
@@ -0,0 +1,69 @@
+#
+# Snapshots: a restored (or cloned) console runs exactly as the original one
+#
+import numpy as np
+import pytest
+
+from atari2600 import Atari2600
+
+def fingerprint(atari):
+    return atari.tia.screen.tobytes(), bytes(atari.system.memory), atari.cycles
+
+def test_restore_mid_frame(rom):
+    atari = Atari2600(rom)
+    atari.run(3)
+    for i in range(100): # Inside the visible lines
+        atari.step()
+    state = atari.save_state()
+    clone = atari.clone()
+    atari.run(3)
+    reference = fingerprint(atari)
+
+    atari.load_state(state)
+    atari.run(3)
+    assert fingerprint(atari) == reference
+    clone.run(3)
+    assert fingerprint(clone) == reference
+    assert all(opFunc.__self__ is clone.cpu and opMode.__self__ is clone.cpu
+               for opFunc, opMode, *entry in clone.cpu.opcode_table)
+    other = Atari2600(rom)
+    other.load_state(state)
+    other.run(3)
+    assert fingerprint(other) == reference
+    assert len(np.unique(atari.tia.screen)) > 1
+
+def test_bad_version_leaves_console_as_is(rom):
+    atari = Atari2600(rom)
+    atari.run(2)
+    state = bytearray(atari.save_state())
+    before = fingerprint(atari)
+    state[0] ^= 0xff
+    with pytest.raises(ValueError):
+        atari.load_state(bytes(state))
+    assert fingerprint(atari) == before
+
+def test_truncated_state_leaves_console_as_is(rom):
+    atari = Atari2600(rom)
+    atari.run(2)
+    for i in range(100):
+        atari.step()
+    state = atari.save_state()
+    atari.run(1)
+    before = fingerprint(atari)
+    for size in (10, 100, 9000, len(state) - 10, len(state) - 1):
+        with pytest.raises(ValueError):
+            atari.load_state(state[:size])
+        assert fingerprint(atari) == before
+    with pytest.raises(ValueError):
+        atari.load_state(state + b'\x00')
+    assert fingerprint(atari) == before
+
+def test_load_state_cartridge_and_clone_timing(rom):
+    atari = Atari2600(rom, timing=True)
+    atari.run(2)
+    empty = Atari2600()
+    empty.load_state(atari.save_state())
+    assert empty.rom == rom
+    clone = atari.clone()
+    clone.run(1)
+    assert clone.timing['cpu'] > 0 and clone.frame_cnt == atari.frame_cnt + 1
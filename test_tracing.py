@@ -0,0 +1,23 @@
+#
+# Tracer: every bus access is recorded, whatever the execution path
+#
+import tracing
+from atari2600 import Atari2600
+
+def test_ram_opcode_fetches_traced(tmp_path):
+    rom = bytearray(0x1000)
+    rom[:9] = bytes([
+        0xa9, 0x60,       # F000        LDA #$60     RAM $80: RTS
+        0x85, 0x80,       # F002        STA $80
+        0x20, 0x80, 0x00, # F004 loop:  JSR $0080
+        0x4c, 0x04, 0xf0, # F007        JMP loop
+    ])
+    rom[0xffc:0xffe] = bytes([0x00, 0xf0])
+    path = tmp_path / 'run.trace'
+    with tracing.Tracer(path, bus=2) as tracer:
+        atari = Atari2600(bytes(rom), translate=False, tracer=tracer)
+        for i in range(10):
+            atari.step()
+    reads = [addr for category, event, addr, value, clk in tracing.read(path)
+             if category == tracing.BUS and event == tracing.EV_READ]
+    assert reads.count(0x80) > 10
@@ -0,0 +1,19 @@
+#
+# VecAtari: workers step in lockstep and write their observations in place
+#
+import numpy as np
+
+from atari2600 import Atari2600
+from vec import VecAtari
+
+def test_screen_obs_match_single_console(rom):
+    reference = Atari2600(rom)
+    reference.run(8)
+    with VecAtari(rom, 2, obs_type="screen", repeat=4) as envs:
+        envs.reset()
+        envs.step([0, 0])
+        obs, rewards, dones, infos = envs.step([0, 0])
+        assert [info["frame"] for info in infos] == [8, 8]
+        assert not dones.any()
+        for screen in obs:
+            assert np.array_equal(screen, reference.tia.screen)
@@ -16,17 +16,56 @@
 # - Reset tbe number of cycles at the end of each line. Assuming NTSC:
 # First mid-line starts at cycle 68 and the second one at 148. HSYNC is at 228.
 #
+import struct
 import numpy as np
-import pygame
+
+import tracing
+from video import NullVideo
 
 def print_debug(text):
     pass
     #print(text)
 
+def _wrapped_masks(patterns):
+    ''' Object masks for any horizontal position, wrapping included.
+        patterns: [..., width] object pixels when placed at position 0
+        Each pattern is stored twice in a 320-pixel mask (at 0 and 160), so the
+        160-pixel mask of the object at position pos is just a view:
+            masks[..., start:start+160], start = (-pos) % 160
+    '''
+    patterns = np.asarray(patterns, dtype=bool)
+    width = patterns.shape[-1]
+    masks = np.zeros(patterns.shape[:-1] + (320,), dtype=bool)
+    masks[..., :width] = patterns
+    masks[..., 160:160+width] = patterns
+    return masks
+
+def _player_patterns():
+    ''' Player pixels at position 0: [size][reflected][graphics][32] '''
+    patterns = np.zeros((5, 2, 256, 32), dtype=bool)
+    bits = np.array([[num & (0x80>>i) for i in range(8)] for num in range(256)], dtype=bool)
+    for size in (1, 2, 4):
+        pixels = np.repeat(bits, size, axis=1)
+        patterns[size, 0, :, :8*size] = pixels
+        patterns[size, 1, :, :8*size] = pixels[:, ::-1]
+    return patterns
+
 class TIA:
 
     dec2bin = [ [num & (0x80>>i) for i in range(8)] for num in range(256)]
 
+    # Player masks: [size][reflected][graphics] (sizes 1, 2 and 4)
+    GRP_masks = _wrapped_masks(_player_patterns())
+    # Missile and ball masks: [size] (sizes 1, 2, 4 and 8, 0 if disabled)
+    LINE_masks = _wrapped_masks([[1]*size + [0]*(8-size) for size in range(9)])
+    # Playfield register bits to pixels (4 pixels per bit), see playfield
+    pf0ToBin = np.array([[ j&(0x01<<i) for i in range(4)] for j in range(16)]).repeat(4, axis=1)
+    pf1ToBin = np.array([[ j&(0x80>>i) for i in range(8)] for j in range(256)]).repeat(4, axis=1)
+    pf2ToBin = np.array([[ j&(0x01<<i) for i in range(8)] for j in range(256)]).repeat(4, axis=1)
+    pf0ToBinR = pf0ToBin[:, ::-1]
+    pf1ToBinR = pf1ToBin[:, ::-1]
+    pf2ToBinR = pf2ToBin[:, ::-1]
+
     #
     # Registers
     #
@@ -115,13 +154,72 @@ class TIA:
                      0x2C3000, 0x4C501C, 0x687034, 0x848C4C, 0x9CA864, 0xB4C078, 0xCCD488, 0xE0EC9C,
                      0x442800, 0x644818, 0x846830, 0xA08444, 0xB89C58, 0xD0B46C, 0xE8CC7C, 0xFCE08C ]
     
+    #
+    # Collisions
+    #
+    # Objects, bit in the per-pixel object code (see line_update)
+    OBJECTS = ['P0', 'P1', 'M0', 'M1', 'BL', 'PF']
+    # Collision latches: (object 1, object 2, register, bit)
+    COLLISIONS = [('P0', 'P1', CXPPMM, 0x80), ('P0', 'M0', CXM0P,  0x40), ('P0', 'M1', CXM1P,  0x80),
+                  ('P0', 'BL', CXP0FB, 0x40), ('P0', 'PF', CXP0FB, 0x80), ('P1', 'M0', CXM0P,  0x80),
+                  ('P1', 'M1', CXM1P,  0x40), ('P1', 'BL', CXP1FB, 0x40), ('P1', 'PF', CXP1FB, 0x80),
+                  ('M0', 'M1', CXPPMM, 0x40), ('M0', 'BL', CXM0FB, 0x40), ('M0', 'PF', CXM0FB, 0x80),
+                  ('M1', 'BL', CXM1FB, 0x40), ('M1', 'PF', CXM1FB, 0x80), ('BL', 'PF', CXBLPF, 0x80)]
+    # Object code -> collision latches set (CXM0P - CXPPMM)
+    CX_LATCHES = np.zeros((64, 8), dtype=np.uint8)
+    for _code in range(64):
+        for _obj1, _obj2, _reg, _bit in COLLISIONS:
+            if _code >> OBJECTS.index(_obj1) & _code >> OBJECTS.index(_obj2) & 1:
+                CX_LATCHES[_code, _reg] |= _bit
+    del _code, _obj1, _obj2, _reg, _bit
+
+    CX_LINES = 262 # Lines of object codes kept until the latches are updated
+
+    PF_CACHE_SIZE = 256 # Max number of cached playfield masks (see playfield)
+
+    #
+    # Machine state (see save_state): scalars, then the variable-length parts
+    # (colubk entries, recorded frame_state lines) counted at the end
+    #
+    STATE = struct.Struct('<5i9i6ii??ii')
+    LINE_MASKS   = ('pf', 'p0', 'p1', 'm0', 'm1', 'bl') # frame_state masks, saved as bits
+    LINE_SIZE    = 160 + 5 + len(LINE_MASKS) * 160 // 8  # Saved frame_state line: bk, colors, masks
+    STATE_ARRAYS = ('P0_GR', 'P1_GR', 'M0_GR', 'M1_GR', 'BL_GR', 'objects', 'blank_rows') # blank_rows last (see state_size)
+
     colorMap = [[color>>16, (color>>8)&0xff, color&0xff] for color in NTSC_colorMap]
+    palette  = np.array(colorMap, dtype=np.uint8) # Palette index (color register >> 1) -> RGB
+
+    #
+    # Deferred rendering (see record_line and render_frame)
+    #
+    # Effective state of each visible line, recorded at the end of the line
+    LINE_STATE = np.dtype([
+        ('bk',     np.uint8, 160), # Background color register, per pixel (COLUBK may change mid-line)
+        ('pf',     np.bool_, 160), # Playfield
+        ('p0',     np.bool_, 160), # Player 0
+        ('p1',     np.bool_, 160), # Player 1
+        ('m0',     np.bool_, 160), # Missile 0
+        ('m1',     np.bool_, 160), # Missile 1
+        ('bl',     np.bool_, 160), # Ball
+        ('colors', np.uint8, 5),   # Color registers: PF left, PF right, P0/M0, P1/M1, BL
+    ])
     
 
-    def __init__(self, system):
+    def __init__(self, system, deferred=False, video=None, frameskip=1):
+        ''' deferred:  record the state of each line and render the whole frame
+                       at once in frame_update (see render_frame), instead of
+                       drawing each line when it ends (see draw_line)
+            video:     video output each frame is handed to (see video.py).
+                       Default: NullVideo (headless)
+            frameskip: render one frame out of 'frameskip'. 0: only the frames
+                       requested (see request_frame)
+        '''
 
         # Global information (clk_cycles, memory, ...)
         self.system = system
+
+        # Write-only registers, as seen by the TIA (see write)
+        self.regs = bytearray(0x40)
         
         # Graphics position
         self.P0_pos = 0
@@ -130,7 +228,23 @@ class TIA:
         self.M1_pos = 0
         self.BL_pos = 0
 
-        self.screen = np.zeros((160, 192+20, 3), dtype=np.uint8)
+        # Framebuffer of palette indices (color register >> 1), see rgb().
+        # Row-major: screen[line] is one contiguous scanline. The video output
+        # gets the (160, 192+20) transposed view, no copy involved
+        self.screen = np.zeros((192+20, 160), dtype=np.uint8)
+
+        # Deferred rendering: one entry per visible line
+        self.deferred    = deferred
+        self.frame_state = np.zeros(192+20, dtype=TIA.LINE_STATE)
+
+        # Screen rows blanked (VBLANK) in the last frame
+        self.blank_rows = np.zeros(192+20, dtype=np.bool)
+
+        # Frameskip: skipped frames are not drawn nor handed to the video output,
+        # but objects and collisions are still updated each line (see line_update)
+        self.frameskip       = frameskip
+        self.frame_requested = False
+        self.rendering       = True # Current frame is rendered
 
         # register table
         self.reg_w_table = [
@@ -155,6 +269,10 @@ class TIA:
 
         # TIA signals
         self.vsync = 0
+        self.vblank      = 0     # VBLANK D1
+        self.line_vblank = 0     # Current line blanked (VBLANK set at its start)
+        self.vblank_end  = None  # Line where VBLANK was cleared in this frame
+        self.first_line  = 40    # Line drawn at the top of the screen
         self.wsync = 0
         self.rsync = 0
         self.line  = 0
@@ -164,7 +282,7 @@ class TIA:
 
         # Playfield (40 bits)
         self.pf0_l = self.pf0_r = self.pf1_l = self.pf1_r = self.pf2_l = self.pf2_r = 0
-        self.ppf_mirror = 0
+        self.pf_mirror = 0
 
         # Sprites
         self.P0_GR = np.zeros((3,3), dtype=np.uint8)
@@ -176,41 +294,54 @@ class TIA:
         self.GRP_dist   = [0, 16, 32, 16, 64, 0, 32, 0]
         self.GRP_copies = [1,  2,  2,  3,  2, 1,  3, 1]
 
-        self.P0_line = np.zeros((160,), dtype=np.bool)
-        self.P1_line = np.zeros((160,), dtype=np.bool)
-        self.M0_line = np.zeros((160,), dtype=np.bool)
-        self.M1_line = np.zeros((160,), dtype=np.bool)
-        self.BL_line = np.zeros((160,), dtype=np.bool)
-        self.PF_line = np.zeros((160,), dtype=np.bool)
+        # Object masks of the line: one row per object (see OBJECTS)
+        self.objects = np.zeros((len(TIA.OBJECTS), 160), dtype=np.bool)
+        self.P0_line = self.objects[0]
+        self.P1_line = self.objects[1]
+        self.M0_line = self.objects[2]
+        self.M1_line = self.objects[3]
+        self.BL_line = self.objects[4]
+        self.PF_line = self.objects[5]
         self.PF0_line = np.zeros((80,), dtype=np.bool) # PF (left PF)
         self.PF1_line = np.zeros((80,), dtype=np.bool) # PF (right PF)
-        
-        self.pf0ToBin = np.array([[ j&(0x01<<i) for i in range(4)] for j in range(16)]).repeat(4, axis=1)
-        self.pf1ToBin = np.array([[ j&(0x80>>i) for i in range(8)] for j in range(256)]).repeat(4, axis=1)
-        self.pf2ToBin = np.array([[ j&(0x01<<i) for i in range(8)] for j in range(256)]).repeat(4, axis=1)
-        self.pf0ToBinR = [ vec[::-1] for vec in self.pf0ToBin]
-        self.pf1ToBinR = [ vec[::-1] for vec in self.pf1ToBin]
-        self.pf2ToBinR = [ vec[::-1] for vec in self.pf2ToBin]
 
 
-        pygame.init()
-        # Scaling by is faster than using pygame.SCALED flag
-        self.display = pygame.display.set_mode([320*3,(192+20)*3])
-        self.surface = pygame.Surface((160, 192+20))
+        # Playfield masks cache (see playfield). pf_hits/pf_misses count the
+        # lines whose mask was reused/built
+        self.pf_cache  = {}
+        self.pf_key    = None # Key of the mask in PF_line
+        self.pf_hits   = 0
+        self.pf_misses = 0
+
+        # Video output (see video.py)
+        self.video = video if video is not None else NullVideo()
+
+        # Collisions: per-pixel object codes of the lines not yet applied to
+        # the collision latches (see update_collisions)
+        self.cx_codes   = np.zeros((TIA.CX_LINES, 160), dtype=np.uint8)
+        self.cx_pending = 0
 
-    def write(self, addr):
-        ''' TIA register write operation '''
+    def write(self, addr, value, clk):
+        ''' TIA register write operation
+            Writes are queued by the CPU and consumed in batches (see
+            cpu.events), so the value and color clock of the write are given
+            and the TIA keeps its own copy of the registers (regs)
+        '''
         if addr < len(self.reg_w_table):
-            self.reg_w_table[addr]()
+            self.regs[addr] = value
+            self.reg_w_table[addr](value, clk)
         else:
             print('Non=existing register')
 
     def read(self, addr):
         ''' TIA register read operation 
             Read address space relocated to 0x100-0x10D to avoid collision with
-            write address space
+            write address space.
+            Collision latches are only updated when read (see update_collisions)
         '''
-        if addr <= INPT5:
+        if addr <= TIA.CXPPMM:
+            self.update_collisions()
+        if addr <= TIA.INPT5:
             return self.system.memory[addr | 0x100]
 #        if addr < len(self.reg_r_table):
 #            reg_r_table[addr]()
@@ -231,7 +362,7 @@ class TIA:
     #
     # Register read/write
     #
-    def w_VSYNC(self):
+    def w_VSYNC(self, value, clk):
 #        print_debug_debug("VSYNC val:{}, clk_cycles:{}, total_cycles:{}, line:{}".format(value, clk_cycles, total_cycles, line))
         #if value != 0:
         #    self.vsync = 1
@@ -240,146 +371,152 @@ class TIA:
         #        self.vsync = 2
 
         # vsync negative edge
-        if self.system.memory[TIA.VSYNC] == 0 and self.vsync != 0:
+        if value == 0 and self.vsync != 0:
             self.vsync = 2
 
-        self.vsync = self.system.memory[TIA.VSYNC] 
+        self.vsync = value 
 
         #if self.system.memory[TIA.VSYNC] != 0:
         #    self.vsync
 
-    def w_VBLANK(self):
-        print_debug("VBLANK not yet implmented")
-
-    def w_WSYNC(self):
+    def w_VBLANK(self, value, clk):
+        vblank = value & 0x02
+        if self.vblank and not vblank:
+            # First unblanked line of the frame: this one unless HBLANK is over
+            self.vblank_end = self.line + (clk >= 68)
+        self.vblank = vblank
+        if clk < 68: # Still in HBLANK: the whole visible line is affected
+            self.line_vblank = vblank
+        print_debug("VBLANK D6/D7 (input control) not yet implmented")
+
+    def w_WSYNC(self, value, clk):
         #clk_cycles = 228 # NTSC
         self.wsync = 1
         #print_debug_debug('WSYNC line {}, PC {}'.format(line, hex(PC)))
         self.system.clk_cycles = 228
 
-    def w_RSYNC(self):
+    def w_RSYNC(self, value, clk):
         self.rsync = 1
         self.system.clk_cycles = 225
         print_debug("RSYNC not yet implmented")
 
-    def w_NUSIZ0(self):
+    def w_NUSIZ0(self, value, clk):
         print_debug("NUSIZE0 not yet implmented")
 
-    def w_NUSIZ1(self):
+    def w_NUSIZ1(self, value, clk):
         print_debug("NUSIZE1 not yet implmented")
 
-    def w_COLUP0(self):
+    def w_COLUP0(self, value, clk):
         print_debug("COLUP0 not yet implmented")
         
-    def w_COLUP1(self):
+    def w_COLUP1(self, value, clk):
         print_debug("COLUP1 not yet implmented")
 
-    def w_COLUPF(self):
+    def w_COLUPF(self, value, clk):
         print_debug("COLUPF not yet implmented")
 
-    def w_COLUBK(self):
+    def w_COLUBK(self, value, clk):
         #cycles = clk_cycles - 68 if clk_cycles >= 68 else 0
         #colubk.append([cycles, value])
-        if self.system.clk_cycles >= 68:
-            self.colubk.append([self.system.clk_cycles - 68,
-                                self.system.memory[TIA.COLUBK]])
+        if clk >= 68:
+            self.colubk.append([clk - 68, value])
         else:
-            self.colubk[0] = [0, self.system.memory[TIA.COLUBK]]
+            self.colubk[0] = [0, value]
         #print_debug('COLUBK', value, line)
 
-    def w_CTRLPF(self):
-        if self.system.clk_cycles < 148: # Before half-line
-            self.pf_mirror = 1 if self.system.memory[TIA.CTRLPF] & 0x01 else 0
+    def w_CTRLPF(self, value, clk):
+        if clk < 148: # Before half-line
+            self.pf_mirror = 1 if value & 0x01 else 0
 
-    def w_REFP0(self):
+    def w_REFP0(self, value, clk):
         print_debug("REFP0 not yet implmented")
 
-    def w_REFP1(self):
+    def w_REFP1(self, value, clk):
         print_debug("REFP1 not yet implmented")
 
-    def w_PF0(self):
-        if self.system.clk_cycles < 48:
-            self.pf0_l = self.system.memory[TIA.PF0]
-            self.pf0_r = self.system.memory[TIA.PF0]
-        elif self.system.clk_cycles < 148:
-            self.pf0_r = self.system.memory[TIA.PF0]
+    def w_PF0(self, value, clk):
+        if clk < 48:
+            self.pf0_l = value
+            self.pf0_r = value
+        elif clk < 148:
+            self.pf0_r = value
             #TODO>review... upto 228
 
-    def w_PF1(self):
-        if self.system.clk_cycles < 84:
-            self.pf1_l = self.system.memory[TIA.PF1]
-            self.pf1_r = self.system.memory[TIA.PF1]
-        elif self.system.clk_cycles < 164:
-            self.pf1_r = self.system.memory[TIA.PF1]
-
-    def w_PF2(self):
-        if self.system.clk_cycles < 116:
-            self.pf2_l = self.system.memory[TIA.PF2]
-            self.pf2_r = self.system.memory[TIA.PF2]
-        elif self.system.clk_cycles < 196:
-            self.pf2_r = self.system.memory[TIA.PF2]
-
-    def w_RESP0(self):
+    def w_PF1(self, value, clk):
+        if clk < 84:
+            self.pf1_l = value
+            self.pf1_r = value
+        elif clk < 164:
+            self.pf1_r = value
+
+    def w_PF2(self, value, clk):
+        if clk < 116:
+            self.pf2_l = value
+            self.pf2_r = value
+        elif clk < 196:
+            self.pf2_r = value
+
+    def w_RESP0(self, value, clk):
         # Single scalar, so assumng a single update during the line
-        self.P0_pos = self.system.clk_cycles - 68 + 5 if self.system.clk_cycles >= 68 else 1
+        self.P0_pos = clk - 68 + 5 if clk >= 68 else 1
         #print_debug_debug("RESP0 pos:{}, line:{}, frame_cnt:{}".format(P0_pos, line, frame_cnt))
 
-    def w_RESP1(self):
-        self.P1_pos = self.system.clk_cycles - 68 + 5 if self.system.clk_cycles >= 68 else 1
+    def w_RESP1(self, value, clk):
+        self.P1_pos = clk - 68 + 5 if clk >= 68 else 1
         #print_debug_debug("RESP1 pos:{}".format(P0_pos))
 
-    def w_RESM0(self):
-        self.M0_pos = self.system.clk_cycles - 68 if self.system.clk_cycles >= 68 else 1
+    def w_RESM0(self, value, clk):
+        self.M0_pos = clk - 68 if clk >= 68 else 1
 
-    def w_RESM1(self):
-        self.M1_pos = self.system.clk_cycles - 68 if self.system.clk_cycles >= 68 else 1
+    def w_RESM1(self, value, clk):
+        self.M1_pos = clk - 68 if clk >= 68 else 1
 
-    def w_RESBL(self):
-        self.BL_pos = self.system.clk_cycles - 68 if self.system.clk_cycles >= 68 else 1
+    def w_RESBL(self, value, clk):
+        self.BL_pos = clk - 68 if clk >= 68 else 1
 
-    def w_AUDC0(self):
+    def w_AUDC0(self, value, clk):
         print_debug("AUDC0 not yet implmented")
 
-    def w_AUDC1(self):
+    def w_AUDC1(self, value, clk):
         print_debug("AUDC1 not yet implmented")
 
-    def w_AUDF0(self):
+    def w_AUDF0(self, value, clk):
         print_debug("AUDF0 not yet implmented")
 
-    def w_AUDF1(self):
+    def w_AUDF1(self, value, clk):
         print_debug("AUDF1 not yet implmented")
 
-    def w_AUDV0(self):
+    def w_AUDV0(self, value, clk):
         print_debug("AUDV0 not yet implmented")
 
-    def w_AUDV1(self):
+    def w_AUDV1(self, value, clk):
         print_debug("AUDV1 not yet implmented")
 
-    def w_GRP0(self):
+    def w_GRP0(self, value, clk):
         # Add color
         #TODO: access to memory
-        nusiz0 = self.system.memory[TIA.NUSIZ0] & 0x07
+        nusiz0 = self.regs[TIA.NUSIZ0] & 0x07
         size   = self.GRP_size[nusiz0]
         dist   = self.GRP_dist[nusiz0]
         copies = self.GRP_copies[nusiz0]
         
-        grp = self.system.memory[TIA.GRP0]
+        grp = value
 
         if copies == 1:
-            if self.system.clk_cycles < (self.P0_pos + 68):
+            if clk < (self.P0_pos + 68):
                 self.P0_GR[0,:] = [grp, self.P0_pos, size]
         elif copies == 2:
-            if self.system.clk_cycles < (self.P0_pos + 68):
+            if clk < (self.P0_pos + 68):
                 self.P0_GR[0,:] = [grp, self.P0_pos, size]
-            elif self.system.clk_cycles < (self.P0_pos + 68 + dist):
+            elif clk < (self.P0_pos + 68 + dist):
                 #TODO; esta variable (pos) no existe... yas'i estaba originalmente
                 self.P0_GR[1,:] = [grp, pos, size]
         elif copies == 3:
-            if self.system.clk_cycles < (self.P0_pos + 68):
+            if clk < (self.P0_pos + 68):
                 self.P0_GR[0,:] = [grp, self.P0_pos, size]
-            elif self.system.clk_cycles < (self.P0_pos + 68 + dist):
+            elif clk < (self.P0_pos + 68 + dist):
                 self.P0_GR[1,:] = [grp, pos, size]
-            elif self.system.clk_cycles < (self.P0_pos + 68 + 2*dist):
+            elif clk < (self.P0_pos + 68 + 2*dist):
                 self.P0_GR[2,:] = [grp, pos, size]
 
 
@@ -409,97 +546,134 @@ class TIA:
         #        if self.system.clk_cycles < (pos + 68):
         #            P0_line[pos : pos+(8*size)] = data
 
-    def w_GRP1(self):
+    def w_GRP1(self, value, clk):
         #print_debug('GRP1', value, line, frame_cnt, self.system.clk_cycles/3, memory[0xb3], memory[0xa6])
-        nusiz1 = self.system.memory[TIA.NUSIZ1] & 0x07
+        nusiz1 = self.regs[TIA.NUSIZ1] & 0x07
         size   = self.GRP_size[nusiz1]
         dist   = self.GRP_dist[nusiz1]
         copies = self.GRP_copies[nusiz1]
         
-        grp = self.system.memory[TIA.GRP1]
+        grp = value
 
         if copies == 1:
-            if self.system.clk_cycles < (self.P1_pos + 68):
+            if clk < (self.P1_pos + 68):
                 self.P1_GR[0,:] = [grp, self.P1_pos, size]
         elif copies == 2:
-            if self.system.clk_cycles < (self.P1_pos + 68):
+            if clk < (self.P1_pos + 68):
                 self.P1_GR[0,:] = [grp, self.P1_pos, size]
-            elif self.system.clk_cycles < (self.P1_pos + 68 + dist):
+            elif clk < (self.P1_pos + 68 + dist):
                 self.P1_GR[1,:] = [grp, pos, size]
         elif copies == 3:
-            if self.system.clk_cycles < (self.P1_pos + 68):
+            if clk < (self.P1_pos + 68):
                 self.P1_GR[0,:] = [grp, self.P1_pos, size]
-            elif self.system.clk_cycles < (self.P1_pos + 68 + dist):
+            elif clk < (self.P1_pos + 68 + dist):
                 self.P1_GR[1,:] = [grp, pos, size]
-            elif self.system.clk_cycles < (self.P1_pos + 68 + 2*dist):
+            elif clk < (self.P1_pos + 68 + 2*dist):
                 self.P1_GR[2,:] = [grp, pos, size]
 
-    def w_ENAM0(self):
+    def w_ENAM0(self, value, clk):
         print_debug("ENAM0 not yet implmented")
 
-    def w_ENAM1(self):
+    def w_ENAM1(self, value, clk):
         print_debug("ENAM1 not yet implmented")
 
-    def w_ENABL(self):
+    def w_ENABL(self, value, clk):
         print_debug("ENABL not yet implmented")
 
-    def w_HMP0(self):
+    def w_HMP0(self, value, clk):
         print_debug("HMP0 not yet implmented")
 
-    def w_HMP1(self):
+    def w_HMP1(self, value, clk):
         print_debug("HMP1 not yet implmented")
 
-    def w_HMM0(self):
+    def w_HMM0(self, value, clk):
         print_debug("HMM0 not yet implmented")
 
-    def w_HMM1(self):
+    def w_HMM1(self, value, clk):
         print_debug("HMM1 not yet implmented")
 
-    def w_HMBL(self):
+    def w_HMBL(self, value, clk):
         print_debug("HMBL not yet implmented")
 
-    def w_VDELP0(self):
+    def w_VDELP0(self, value, clk):
         print_debug("VDELP0 not yet implmented")
 
-    def w_VDELP1(self):
+    def w_VDELP1(self, value, clk):
         print_debug("VDELP1 not yet implmented")
 
-    def w_VDELBL(self):
+    def w_VDELBL(self, value, clk):
         print_debug("VDELBL not yet implmented")
 
-    def w_RESMP0(self):
-        if (self.system.memory[TIA.RESMP0] >> 1) & 0x01:
+    def w_RESMP0(self, value, clk):
+        if (value >> 1) & 0x01:
             self.M0_pos = self.P0_pos + 4 # Middle of the P0
 
-    def w_RESMP1(self):
-        if (self.system.memory[TIA.RESMP1]  >> 1) & 0x01:
+    def w_RESMP1(self, value, clk):
+        if (value  >> 1) & 0x01:
             self.M1_pos = self.P1_pos + 4 # Middle of the P1
 
-    def w_HMOVE(self):
-        memory = self.system.memory
-        tmp = memory[TIA.HMP0] >> 4
+    def w_HMOVE(self, value, clk):
+        regs = self.regs
+        tmp = regs[TIA.HMP0] >> 4
         self.P0_pos -= tmp if tmp < 8 else (tmp - 16)   # -8 ... +7
-        tmp = self.system.memory[TIA.HMP1] >> 4
+        tmp = regs[TIA.HMP1] >> 4
         self.P1_pos -= tmp if tmp < 8 else (tmp - 16)
-        tmp = memory[TIA.HMM0] >> 4
+        tmp = regs[TIA.HMM0] >> 4
         self.M0_pos -= tmp if tmp < 8 else (tmp - 16)
-        tmp = memory[TIA.HMM1] >> 4
+        tmp = regs[TIA.HMM1] >> 4
         self.M1_pos -= tmp if tmp < 8 else (tmp - 16)
-        tmp = memory[TIA.HMBL] >> 4
+        tmp = regs[TIA.HMBL] >> 4
         self.BL_pos -= tmp if tmp < 8 else (tmp - 16)
 
-    def w_HMCLR(self):
-        memory = self.system.memory
-        memory[TIA.HMP0] = 0
-        memory[TIA.HMP1] = 0
-        memory[TIA.HMM0] = 0
-        memory[TIA.HMM1] = 0
-        memory[TIA.HMBL] = 0
+    def w_HMCLR(self, value, clk):
+        regs = self.regs
+        regs[TIA.HMP0] = 0
+        regs[TIA.HMP1] = 0
+        regs[TIA.HMM0] = 0
+        regs[TIA.HMM1] = 0
+        regs[TIA.HMBL] = 0
 
-    def w_CXCLR(self):
+    def w_CXCLR(self, value, clk):
+        self.cx_pending = 0
         for i in range(8):
             self.system.memory[0x100 + i] = 0
 
+    def update_collisions(self):
+        ''' Apply the collisions of the pending lines to the latches (CXM0P -
+            CXPPMM): every object code present sets the latches of the objects
+            overlapping in it (see CX_LATCHES)
+        '''
+        if self.cx_pending == 0:
+            return
+        present = np.zeros(64, dtype=np.bool)
+        present[self.cx_codes[:self.cx_pending]] = True
+        self.cx_pending = 0
+
+        memory  = self.system.memory
+        old     = np.frombuffer(bytes(memory[0x100:0x108]), dtype=np.uint8)
+        latches = np.bitwise_or.reduce(TIA.CX_LATCHES[present], axis=0) | old
+        memory[0x100:0x108] = latches.tobytes()
+
+    def set_tracer(self, tracer):
+        ''' Trace the collision latches set (tia level 2, see tracing.py):
+            one record per latch register (CXM0P - CXPPMM) with the new bits.
+            Installed on this instance only (see cpu.set_tracer, which calls it)
+        '''
+        self.__dict__.pop('update_collisions', None)
+        if tracer is None or tracer.level(tracing.TIA) < 2:
+            return
+
+        record = tracer.record
+        memory = self.system.memory
+        def traced_update(update=self.update_collisions):
+            old = bytes(memory[0x100:0x108])
+            update()
+            for reg in range(TIA.CXPPMM + 1):
+                new = memory[0x100 | reg] & ~old[reg]
+                if new:
+                    record(tracing.TIA, tracing.EV_COLLISION, reg, new, self.system.clk_cycles)
+        self.update_collisions = traced_update
+
     #
     # Draw
     #
@@ -508,19 +682,19 @@ class TIA:
         Instead of updating display in real time, we'll keep track of any operation
         done over TIA registers and then we'll update the whole line at once
         '''
-        memory = self.system.memory
+        regs = self.regs
         
-        line_visible = self.line - 40
-        screen_line = self.screen[:, line_visible]
+        line_visible = self.line - self.first_line
+        screen_line = self.screen[line_visible]
         
         # Update background
         s2 = self.colubk[0][0]
         for i in range(len(self.colubk) - 1):
             s1 = s2
             s2 = self.colubk[i+1][0]
-            color = TIA.colorMap[self.colubk[i][1]>>1]
+            color = self.colubk[i][1]>>1
             screen_line[s1:s2] = color
-        color = TIA.colorMap[(self.colubk[-1][1]>>1)]
+        color = self.colubk[-1][1]>>1
         screen_line[s2:160] = color
         
         # Priority depends on CTRLPF.D2: assume it is 0 at this moment
@@ -529,11 +703,11 @@ class TIA:
         
         # Update PlayFields
         # Simplification: assume color changes, at most, once each line 
-        if memory[TIA.CTRLPF] & 0x02:
-            PF_color1 = TIA.colorMap[memory[TIA.COLUP0]>>1]
-            PF_color2 = TIA.colorMap[memory[TIA.COLUP1]>>1]
+        if regs[TIA.CTRLPF] & 0x02:
+            PF_color1 = regs[TIA.COLUP0]>>1
+            PF_color2 = regs[TIA.COLUP1]>>1
         else:
-            PF_color1 = TIA.colorMap[memory[TIA.COLUPF]>>1]
+            PF_color1 = regs[TIA.COLUPF]>>1
             PF_color2 = PF_color1
     
         #a1 = time.clock()
@@ -701,8 +875,8 @@ class TIA:
     
         # Update GPs and missiles
         size = 1
-        P0_color = TIA.colorMap[memory[TIA.COLUP0]>>1] # assuming no change in color during the first half-line
-        P1_color = TIA.colorMap[memory[TIA.COLUP1]>>1] # idem for second half-line
+        P0_color = regs[TIA.COLUP0]>>1 # assuming no change in color during the first half-line
+        P1_color = regs[TIA.COLUP1]>>1 # idem for second half-line
     
         # Update Players 0 and 1
         screen_line[self.P0_line>0] = P0_color
@@ -713,37 +887,130 @@ class TIA:
         screen_line[self.M1_line>0] = P1_color
     
         # Update Ball
-        BL_color = TIA.colorMap[memory[TIA.COLUPF]>>1]
+        BL_color = regs[TIA.COLUPF]>>1
         screen_line[self.BL_line>0] = BL_color
 
+    def record_line(self):
+        '''
+        Deferred rendering: instead of drawing the line, just store what draw_line
+        would use to draw it. The whole frame is drawn at once by render_frame
+        '''
+        regs  = self.regs
+        state = self.frame_state[self.line - self.first_line]
+
+        # Background
+        bk = state['bk']
+        s2 = self.colubk[0][0]
+        for i in range(len(self.colubk) - 1):
+            s1 = s2
+            s2 = self.colubk[i+1][0]
+            bk[s1:s2] = self.colubk[i][1]
+        bk[s2:160] = self.colubk[-1][1]
+
+        # Objects
+        state['pf'] = self.PF_line
+        state['p0'] = self.P0_line
+        state['p1'] = self.P1_line
+        state['m0'] = self.M0_line
+        state['m1'] = self.M1_line
+        state['bl'] = self.BL_line
+
+        # Colors
+        colors = state['colors']
+        if regs[TIA.CTRLPF] & 0x02:
+            colors[0] = regs[TIA.COLUP0]
+            colors[1] = regs[TIA.COLUP1]
+        else:
+            colors[0] = colors[1] = regs[TIA.COLUPF]
+        colors[2] = regs[TIA.COLUP0]
+        colors[3] = regs[TIA.COLUP1]
+        colors[4] = regs[TIA.COLUPF]
+
+    def render_frame(self):
+        '''
+        Deferred rendering: draw all the visible lines recorded by record_line
+        at once, layer by layer as draw_line does (background, playfield,
+        players, missiles and ball)
+        '''
+        state  = self.frame_state
+        colors = state['colors'][:, :, None]
+
+        frame = state['bk'].copy()
+        np.copyto(frame[:, :80], colors[:, 0], where=state['pf'][:, :80])
+        np.copyto(frame[:, 80:], colors[:, 1], where=state['pf'][:, 80:])
+        np.copyto(frame, colors[:, 2], where=state['p0'])
+        np.copyto(frame, colors[:, 3], where=state['p1'])
+        np.copyto(frame, colors[:, 2], where=state['m0'])
+        np.copyto(frame, colors[:, 3], where=state['m1'])
+        np.copyto(frame, colors[:, 4], where=state['bl'])
+
+        np.right_shift(frame, 1, out=self.screen)
+
+    def rgb(self):
+        ''' RGB copy of the screen: (192+20, 160, 3) '''
+        return TIA.palette[self.screen]
+
+    def playfield(self, key):
+        ''' Playfield mask (shared, read-only) for
+            key: (pf0_l, pf1_l, pf2_l, pf0_r, pf1_r, pf2_r, pf_mirror)
+        '''
+        mask = self.pf_cache.get(key)
+        if mask is not None:
+            self.pf_hits += 1
+            return mask
+        self.pf_misses += 1
+
+        pf0_l, pf1_l, pf2_l, pf0_r, pf1_r, pf2_r, pf_mirror = key
+        mask = np.zeros((160,), dtype=np.bool)
+        mask[0:16]  = self.pf0ToBin[pf0_l >> 4]
+        mask[16:48] = self.pf1ToBin[pf1_l]
+        mask[48:80] = self.pf2ToBin[pf2_l]
+        if not pf_mirror:
+            mask[80:96]  = self.pf0ToBin[pf0_r >> 4]
+            mask[96:128] = self.pf1ToBin[pf1_r]
+            mask[128:]   = self.pf2ToBin[pf2_r]
+        else:
+            mask[80:112]  = self.pf2ToBinR[pf2_r]
+            mask[112:144] = self.pf1ToBinR[pf1_r]
+            mask[144:]    = self.pf0ToBinR[pf0_r >> 4]
+        mask.flags.writeable = False
+
+        # Evict the oldest entry
+        if len(self.pf_cache) >= TIA.PF_CACHE_SIZE:
+            del self.pf_cache[next(iter(self.pf_cache))]
+        self.pf_cache[key] = mask
+
+        return mask
+
     def line_update(self):
 
-        if self.line >= 40 and self.line < (232 + 20):
+        # Blanked lines (VBLANK) go through no composition at all
+        if not self.line_vblank:
 
-            # Playfield
-            self.PF_line[0:16]  = self.pf0ToBin[self.pf0_l >> 4]
-            self.PF_line[16:48] = self.pf1ToBin[self.pf1_l]
-            self.PF_line[48:80] = self.pf2ToBin[self.pf2_l]
-            if not self.pf_mirror:
-                self.PF_line[80:96]  = self.pf0ToBin[self.pf0_r >> 4]
-                self.PF_line[96:128] = self.pf1ToBin[self.pf1_r]
-                self.PF_line[128:]   = self.pf2ToBin[self.pf2_r]
+            # Playfield: unchanged since the previous line (usual case) or cached
+            key = (self.pf0_l, self.pf1_l, self.pf2_l, self.pf0_r, self.pf1_r, self.pf2_r, self.pf_mirror)
+            if key == self.pf_key:
+                self.pf_hits += 1
             else:
-                self.PF_line[80:112]  = self.pf2ToBinR[self.pf2_r]
-                self.PF_line[112:144] = self.pf1ToBinR[self.pf1_r]
-                self.PF_line[144:]    = self.pf0ToBinR[self.pf0_r >> 4]
+                self.PF_line[:] = self.playfield(key)
+                self.pf_key = key
 
             self.PF0_line = self.PF_line[0:80]
             self.PF1_line = self.PF_line[80:]
 
+            # Players: one cached mask per copy (see GRP_masks)
+            masks = TIA.GRP_masks
+            refp0 = (self.regs[TIA.REFP0] >> 3) & 0x01
+            refp1 = (self.regs[TIA.REFP1] >> 3) & 0x01
+
             # Player 0
             #TODO SHIT! this need to be self
-            nusiz0 = self.system.memory[TIA.NUSIZ0] & 0x07
+            nusiz0 = self.regs[TIA.NUSIZ0] & 0x07
             #TODO: dist and size should be used from P0_GR
             dist = self.GRP_dist[nusiz0]
             size = self.GRP_size[nusiz0]
             #TODO SHIT! this need to be self
-            grpx = self.system.memory[TIA.GRP0]
+            grpx = self.regs[TIA.GRP0]
             for i,(grp, _, _) in enumerate(self.P0_GR):
                 if size == 0: 
                     grp  = grpx
@@ -754,17 +1021,14 @@ class TIA:
 
                 pos = self.P0_pos + i*dist
                 if grp != 0:
-                    data = np.repeat(self.dec2bin[grp], size)
-                    # TODO: we can add reverse arg as a new P0_GR item
-                    if self.system.memory[TIA.REFP0] & 0x08:
-                        data = data[::-1]
-                    self.P0_line[pos : pos+len(data)] = data
+                    start = (-pos) % 160
+                    self.P0_line |= masks[size, refp0, grp, start:start+160]
         
             # Player 1
-            nusiz1 = self.system.memory[TIA.NUSIZ1] & 0x07
+            nusiz1 = self.regs[TIA.NUSIZ1] & 0x07
             dist = self.GRP_dist[nusiz1]
             size = self.GRP_size[nusiz1]
-            grpx = self.system.memory[TIA.GRP1]
+            grpx = self.regs[TIA.GRP1]
             for i,(grp, _, size) in enumerate(self.P1_GR):
                 if size == 0:
                     grp  = grpx
@@ -775,129 +1039,86 @@ class TIA:
 
                 pos = self.P1_pos + i*dist
                 if grp != 0:
-                    data = np.repeat(self.dec2bin[grp], size)
-                    if self.system.memory[TIA.REFP1] & 0x08:
-                        data = data[::-1]
-
-                    pos_end = pos+len(data)
-                    if pos_end <= 160:
-                        self.P1_line[pos : pos_end] = data
-                    else:
-                        tmp = pos_end - 160
-                        pos_ini = len(data) - tmp
-                        self.P1_line[pos : ] = data[ : pos_ini]
-                        self.P1_line[ : tmp] = data[pos_ini :]
+                    start = (-pos) % 160
+                    self.P1_line |= masks[size, refp1, grp, start:start+160]
 
 
             # Missile 0
+            masks = TIA.LINE_masks
             for grp, pos, size in self.M0_GR:
                 if grp != 0:
-                    self.M0_line[pos : pos+size] = True
+                    start = -int(pos) % 160
+                    self.M0_line |= masks[size, start:start+160]
         
             # Missile 1
             for grp, pos, size in self.M1_GR:
                 if grp != 0:
-                    self.M1_line[pos : pos+size] = True
+                    start = -int(pos) % 160
+                    self.M1_line |= masks[size, start:start+160]
         
             # Ball
             grp, pos, size = self.BL_GR
             if grp != 0:
-                self.BL_line[pos : pos+size] = True
-
-            # Collisions
-            if (self.P0_line & self.P1_line).any():
-                print("Collision P0-P1")
-                self.system.memory[0x107] |= 0x80
-            if (self.P0_line & self.M0_line).any():
-                print("Collision P0-M0")
-                self.system.memory[0x100] |= 0x40
-            if (self.P0_line & self.M1_line).any():
-                print("Collision P0-M1")
-                self.system.memory[0x101] |= 0x80
-            if (self.P0_line & self.BL_line).any():
-                print("Collision P0-BL")
-                self.system.memory[0x102] |= 0x40
-            if (self.P0_line & self.PF_line).any():
-                print("Collision P0-PF")
-                self.system.memory[0x102] |= 0x80
-
-            if (self.P1_line & self.M0_line).any():
-                print("Collision P1-M0")
-                self.system.memory[0x100] |= 0x80
-            if (self.P1_line & self.M1_line).any():
-                print("Collision P1-M1")
-                self.system.memory[0x101] |= 0x40
-            if (self.P1_line & self.BL_line).any():
-                print("Collision P1-BL")
-                self.system.memory[0x103] |= 0x40
-            if (self.P1_line & self.PF_line).any():
-                print("Collision P1-PF")
-                self.system.memory[0x103] |= 0x80
-
-            if (self.M0_line & self.M1_line).any():
-                print("Collision M0-M1")
-                self.system.memory[0x107] |= 0x40
-            if (self.M0_line & self.BL_line).any():
-                print("Collision M0-BL")
-                self.system.memory[0x104] |= 0x40
-            if (self.M0_line & self.PF_line).any():
-                print("Collision M0-PF")
-                self.system.memory[0x104] |= 0x80
-
-            if (self.M1_line & self.BL_line).any():
-                print("Collision M1-BL")
-                self.system.memory[0x105] |= 0x40
-            if (self.M1_line & self.PF_line).any():
-                print("Collision M1-PF")
-                self.system.memory[0x105] |= 0x80
-
-            if (self.BL_line & self.PF_line).any():
-                print("Collision BL-PF")
-                self.system.memory[0x106] |= 0x80
+                start = -int(pos) % 160
+                self.BL_line |= masks[size, start:start+160]
+
+            # Collisions: just keep which objects are drawn at each pixel, the
+            # latches are only updated when read (see update_collisions)
+            if self.cx_pending == TIA.CX_LINES:
+                self.update_collisions()
+            self.cx_codes[self.cx_pending] = np.packbits(self.objects, axis=0, bitorder='little')
+            self.cx_pending += 1
 
 #        total_cycles += 228
         self.system.clk_cycles %= 228
 #        print_debug("Line {}  PC={} cyles={}".format(line+1, hex(PC), clk_cycles/3))
 
 
-        # Draw line
-        if self.line >= 40 and self.line < (232 + 20):
-            self.draw_line()
+        # Draw line (blanked lines are filled at once at the end of the frame)
+        row = self.line - self.first_line
+        if self.rendering and row >= 0 and row < 192+20:
+            self.blank_rows[row] = self.line_vblank
+            if not self.line_vblank:
+                if self.deferred:
+                    self.record_line()
+                else:
+                    self.draw_line()
 
     def _prepare_next_line(self):
         # Prepare internal vars for the next line
-        self.colubk    = [[0, self.system.memory[TIA.COLUBK]]]
-        self.pf0_l     = self.pf0_r = self.system.memory[TIA.PF0]
-        self.pf1_l     = self.pf1_r = self.system.memory[TIA.PF1]
-        self.pf2_l     = self.pf2_r = self.system.memory[TIA.PF2]
-        self.pf_mirror = 1 if self.system.memory[TIA.CTRLPF] & 0x01 else 0
+        self.line_vblank = self.vblank
+        self.colubk    = [[0, self.regs[TIA.COLUBK]]]
+        self.pf0_l     = self.pf0_r = self.regs[TIA.PF0]
+        self.pf1_l     = self.pf1_r = self.regs[TIA.PF1]
+        self.pf2_l     = self.pf2_r = self.regs[TIA.PF2]
+        self.pf_mirror = 1 if self.regs[TIA.CTRLPF] & 0x01 else 0
 
         #memory[NUSIZ0] = 0
-        nusiz0 = self.system.memory[TIA.NUSIZ0] & 0x07
+        nusiz0 = self.regs[TIA.NUSIZ0] & 0x07
         size   = self.GRP_size[nusiz0]
         dist   = self.GRP_dist[nusiz0]
         copies = self.GRP_copies[nusiz0]
-        nusiz1 = self.system.memory[TIA.NUSIZ1] & 0x07
+        nusiz1 = self.regs[TIA.NUSIZ1] & 0x07
         size1  = self.GRP_size[nusiz1]
         dist1  = self.GRP_dist[nusiz1]
         copies1= self.GRP_copies[nusiz1]
-        sizeM0 = 2 ** ((self.system.memory[TIA.NUSIZ0] >> 4) & 0x03)
-        sizeM1 = 2 ** ((self.system.memory[TIA.NUSIZ1] >> 4) & 0x03)
-        sizeB  = 2 ** ((self.system.memory[TIA.CTRLPF] >> 4) & 0x03)
+        sizeM0 = 2 ** ((self.regs[TIA.NUSIZ0] >> 4) & 0x03)
+        sizeM1 = 2 ** ((self.regs[TIA.NUSIZ1] >> 4) & 0x03)
+        sizeB  = 2 ** ((self.regs[TIA.CTRLPF] >> 4) & 0x03)
         self.P0_GR[:,2] = 0
         self.P1_GR[:,2] = 0
         self.M0_GR[:,2] = 0
         self.M1_GR[:,2] = 0
         self.BL_GR[0] = 0
         for i in range(copies):
-            self.M0_GR[i,0] = ((self.system.memory[TIA.ENAM0] >> 1) & 0x01) & ((~self.system.memory[TIA.RESMP0] >> 1) & 0x01)
+            self.M0_GR[i,0] = ((self.regs[TIA.ENAM0] >> 1) & 0x01) & ((~self.regs[TIA.RESMP0] >> 1) & 0x01)
             self.M0_GR[i,1] = self.M0_pos + i*dist
             self.M0_GR[i,2] = sizeM0
         for i in range(copies1):
-            self.M1_GR[i,0] = ((self.system.memory[TIA.ENAM1] >> 1) & 0x01) & ((~self.system.memory[TIA.RESMP1] >> 1) & 0x01)
+            self.M1_GR[i,0] = ((self.regs[TIA.ENAM1] >> 1) & 0x01) & ((~self.regs[TIA.RESMP1] >> 1) & 0x01)
             self.M1_GR[i,1] = self.M1_pos + i*dist1
             self.M1_GR[i,2] = sizeM1
-        self.BL_GR[0] = ((self.system.memory[TIA.ENABL] >> 1) & 0x01)
+        self.BL_GR[0] = ((self.regs[TIA.ENABL] >> 1) & 0x01)
         self.BL_GR[1] = self.BL_pos
         self.BL_GR[2] = sizeB
 
@@ -930,6 +1151,128 @@ class TIA:
         self.line += 1
 
 
+    def save_state(self):
+        ''' TIA state, packed (see STATE). The framebuffer is output, not
+            state: it is not saved. Pending collisions are applied to the
+            latches first (in memory, saved by the System)
+        '''
+        self.update_collisions()
+        vblank_end = -1 if self.vblank_end is None else self.vblank_end
+        rows = self._recorded_rows()
+        parts = [TIA.STATE.pack(
+            self.P0_pos, self.P1_pos, self.M0_pos, self.M1_pos, self.BL_pos,
+            self.vsync, self.vblank, self.line_vblank, vblank_end, self.first_line,
+            self.wsync, self.rsync, self.line, self.frame_cnt,
+            self.pf0_l, self.pf0_r, self.pf1_l, self.pf1_r, self.pf2_l, self.pf2_r,
+            self.pf_mirror, self.frame_requested, self.rendering,
+            len(self.colubk), rows)]
+        parts.append(bytes(self.regs))
+        parts += [getattr(self, name).tobytes() for name in TIA.STATE_ARRAYS]
+        parts.append(np.array(self.colubk, dtype=np.int16).tobytes())
+        # Lines recorded so far (deferred rendering), object masks as bits
+        if rows:
+            lines = self.frame_state[self._recorded(rows)]
+            masks = np.stack([lines[name] for name in TIA.LINE_MASKS], axis=1)
+            parts += [lines['bk'].tobytes(), lines['colors'].tobytes(), np.packbits(masks, axis=-1).tobytes()]
+        return b''.join(parts)
+
+    def load_state(self, state):
+        ''' Restore the state saved by save_state '''
+        (self.P0_pos, self.P1_pos, self.M0_pos, self.M1_pos, self.BL_pos,
+         self.vsync, self.vblank, self.line_vblank, vblank_end, self.first_line,
+         self.wsync, self.rsync, self.line, self.frame_cnt,
+         self.pf0_l, self.pf0_r, self.pf1_l, self.pf1_r, self.pf2_l, self.pf2_r,
+         self.pf_mirror, self.frame_requested, self.rendering,
+         ncolubk, rows) = TIA.STATE.unpack_from(state)
+        self.vblank_end = None if vblank_end < 0 else vblank_end
+
+        offset = TIA.STATE.size
+        self.regs[:] = state[offset:offset + len(self.regs)]
+        offset += len(self.regs)
+        for name in TIA.STATE_ARRAYS:
+            array = getattr(self, name)
+            array[...] = np.frombuffer(state, array.dtype, array.size, offset).reshape(array.shape)
+            offset += array.nbytes
+        self.colubk = np.frombuffer(state, np.int16, ncolubk * 2, offset).reshape(ncolubk, 2).tolist()
+        offset += ncolubk * 4
+
+        recorded = self._recorded(rows) if rows else ()
+        n = len(recorded)
+        if n: # Nothing recorded at the frame boundaries nor in skipped frames
+            lines = self.frame_state
+            lines['bk'][recorded] = np.frombuffer(state, np.uint8, n * 160, offset).reshape(n, 160)
+            offset += n * 160
+            lines['colors'][recorded] = np.frombuffer(state, np.uint8, n * 5, offset).reshape(n, 5)
+            offset += n * 5
+            packed = np.frombuffer(state, np.uint8, n * len(TIA.LINE_MASKS) * 20, offset)
+            masks = np.unpackbits(packed.reshape(n, len(TIA.LINE_MASKS), 20), axis=-1).view(np.bool)
+            for i, name in enumerate(TIA.LINE_MASKS):
+                lines[name][recorded] = masks[:, i]
+
+        self.cx_pending = 0
+        self.pf_key = None # PF_line (in objects) rebuilt on the next line
+
+    def state_size(self, state):
+        ''' Size of the TIA state saved at the start of 'state' (see
+            save_state), from its fixed part. None if it is not valid
+        '''
+        arrays = [getattr(self, name) for name in TIA.STATE_ARRAYS]
+        fixed  = TIA.STATE.size + len(self.regs) + sum(array.nbytes for array in arrays)
+        if len(state) < fixed:
+            return None
+        ncolubk, rows = TIA.STATE.unpack_from(state)[-2:]
+        if ncolubk < 0 or not 0 <= rows <= len(self.blank_rows):
+            return None
+        blank_rows = np.frombuffer(state, np.bool, rows, fixed - self.blank_rows.nbytes)
+        lines = rows - np.count_nonzero(blank_rows)
+        return fixed + ncolubk * 4 + lines * TIA.LINE_SIZE
+
+    def clone(self, system, video=None):
+        ''' Copy of this TIA on another System, untraced and untimed. Buffers
+            are new (their contents are restored by load_state, but the
+            framebuffer, copied here); the playfield masks cache is copied
+        '''
+        other = TIA.__new__(TIA)
+        # Without the methods installed on this instance (tracer, timing)
+        other.__dict__.update((name, value) for name, value in self.__dict__.items() if not callable(value))
+        other.system = system
+        other.regs   = bytearray(self.regs)
+        other.colubk = [list(change) for change in self.colubk]
+        for name in TIA.STATE_ARRAYS:
+            setattr(other, name, getattr(self, name).copy())
+        other.P0_line, other.P1_line, other.M0_line, other.M1_line, other.BL_line, other.PF_line = other.objects
+        other.PF0_line = other.PF_line[0:80]
+        other.PF1_line = other.PF_line[80:]
+        other.screen      = self.screen.copy()
+        other.frame_state = np.zeros(len(self.frame_state), dtype=TIA.LINE_STATE)
+        other.cx_codes    = np.zeros(self.cx_codes.shape, dtype=np.uint8)
+        other.pf_cache    = dict(self.pf_cache)
+        other.reg_w_table = [getattr(other, write.__name__) for write in self.reg_w_table]
+        other.video = video if video is not None else NullVideo()
+        return other
+
+    def _recorded_rows(self):
+        ''' Screen rows (frame_state lines) gone through so far in the current
+            frame. Only the unblanked ones are recorded (see _recorded)
+        '''
+        if not (self.deferred and self.rendering):
+            return 0
+        return min(max(self.line - self.first_line, 0), len(self.frame_state))
+
+    def _recorded(self, rows):
+        ''' frame_state lines recorded among the first 'rows' rows '''
+        return np.flatnonzero(~self.blank_rows[:rows])
+
+    def request_frame(self):
+        ''' Render the next frame, whatever the frameskip is. Called at a frame
+            boundary (i.e.: after Atari2600.step_frame), it is the frame about
+            to start
+        '''
+        if self.line == 3: # Frame boundary (see frame_update): no line drawn yet
+            self.rendering = True
+        else:
+            self.frame_requested = True
+
     def frame_update(self):
         #print_debug("frame {} line:{}".format(frame_cnt, line))
         self.line = 3
@@ -940,75 +1283,23 @@ class TIA:
         #code.interact(local=locals())
         self.frame_cnt += 1
 #        t1 = t2
+        if self.rendering:
+            if self.deferred:
+                self.render_frame()
+            self.screen[self.blank_rows] = 0
+            self.video.frame(self.screen.T)
+
+        # Visible window of the next frame: from the end of VBLANK
+        if self.vblank_end is not None:
+            self.first_line = self.vblank_end
+            self.vblank_end = None
         #if line >= 262:
         #    line = 0
-        pygame.surfarray.blit_array(self.surface, self.screen)
-        self.display.blit(pygame.transform.scale(self.surface, (320*3,(192+20)*3)), (0, 0))
-        pygame.display.flip()
+
+        # Next frame rendered?
+        self.rendering = self.frame_requested or (self.frameskip > 0 and self.frame_cnt % self.frameskip == 0)
+        self.frame_requested = False
 #        if frame_cnt == 4000:
 #            break
         #time.sleep(1)
 #        print("{} Hz, frame {}".format( 1/(t2-t1), frame_cnt))
-
-        # Input keyboard
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit();
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_0:
-                    self.system.memory[0x282] &= ~0x01    # reset
-                elif event.key == pygame.K_1:
-                    self.system.memory[0x282] &= ~0x02    # select
-                elif event.key == pygame.K_l:
-                    self.system.memory[0x280] &= ~0x80    # P0 right
-                elif event.key == pygame.K_j:
-                    self.system.memory[0x280] &= ~0x40    # P0 left
-                elif event.key == pygame.K_k:
-                    self.system.memory[0x280] &= ~0x20    # P0 down
-                elif event.key == pygame.K_i:
-                    self.system.memory[0x280] &= ~0x10    # P0 up
-                elif event.key == pygame.K_d:
-                    self.system.memory[0x280] &= ~0x08    # P1 right
-                elif event.key == pygame.K_a:
-                    self.system.memory[0x280] &= ~0x04    # P1 left
-                elif event.key == pygame.K_s:
-                    self.system.memory[0x280] &= ~0x02    # P1 down
-                elif event.key == pygame.K_w:
-                    self.system.memory[0x280] &= ~0x01    # P1 up
-                elif event.key == pygame.K_2:
-                    self.system.memory[0x282] ^= 0x80     # P0 difficulty 
-                elif event.key == pygame.K_3:
-                    self.system.memory[0x282] ^= 0x40     # P1 difficulty
-
-                elif event.key == pygame.K_m:
-                    self.system.memory[0x10C] &= ~0x80     # P0 button
-                elif event.key == pygame.K_x:
-                    self.system.memory[0x10D] &= ~0x80     # P1 button
-
-            if event.type == pygame.KEYUP:
-                if event.key == pygame.K_0:
-                    self.system.memory[0x282] |= 0x01
-                elif event.key == pygame.K_1:
-                    self.system.memory[0x282] |= 0x02
-                elif event.key == pygame.K_l:
-                    self.system.memory[0x280] |= 0x80    # P0 right
-                elif event.key == pygame.K_j:
-                    self.system.memory[0x280] |= 0x40    # P0 left
-                elif event.key == pygame.K_k:
-                    self.system.memory[0x280] |= 0x20    # P0 down
-                elif event.key == pygame.K_i:
-                    self.system.memory[0x280] |= 0x10    # P0 up
-                elif event.key == pygame.K_d:
-                    self.system.memory[0x280] |= 0x08    # P1 right
-                elif event.key == pygame.K_a:
-                    self.system.memory[0x280] |= 0x04    # P1 left
-                elif event.key == pygame.K_s:
-                    self.system.memory[0x280] |= 0x02    # P1 down
-                elif event.key == pygame.K_w:
-                    self.system.memory[0x280] |= 0x01    # P1 up
-
-                elif event.key == pygame.K_m:
-                    self.system.memory[0x10C] |= 0x80     # P0 button
-                elif event.key == pygame.K_x:
-                    self.system.memory[0x10D] |= 0x80     # P1 button
@@ -0,0 +1,100 @@
+'''
+Structured trace logging
+
+Trace records are written as compact binary records to a buffered file, one
+record per event:
+
+    category (u8), event (u8), address (u16), value (u16), clk_cycles (u16)
+
+Each category has its own level (0 disables it):
+
+    cpu:  1 -> every executed instruction (PC, opcode)
+    bus:  1 -> memory writes, 2 -> memory writes and reads
+    tia:  1 -> TIA register writes, 2 -> also collision latches set (address:
+             CXM0P - CXPPMM, value: new bits)
+    riot: 1 -> RIOT register writes, 2 -> RIOT register writes and reads
+
+Nothing in the emulator checks whether tracing is enabled: instrumented code is
+only installed on a cpu (and its TIA) when a Tracer is attached to it (see
+cpu.set_tracer), so tracing costs nothing when disabled.
+
+Usage:
+    tracer = Tracer('run.trace', cpu=1, tia=1)
+    cpu.set_tracer(tracer)
+    ...
+    tracer.close()
+
+    python tracing.py run.trace   # dump a trace file as text
+'''
+
+import struct
+import sys
+
+# Categories
+CPU  = 0
+BUS  = 1
+TIA  = 2
+RIOT = 3
+CATEGORIES = ['cpu', 'bus', 'tia', 'riot']
+
+# Events
+EV_INSTR = 0
+EV_READ  = 1
+EV_WRITE = 2
+EV_COLLISION = 3
+EVENTS = ['instr', 'read', 'write', 'collision']
+
+RECORD = struct.Struct('<BBHHH')
+
+
+class Tracer:
+
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path, **levels):
+        ''' path: trace file
+            levels: level per category (i.e.: cpu=1, bus=2). Default 0
+        '''
+        self.levels = [0] * len(CATEGORIES)
+        for name, level in levels.items():
+            self.levels[CATEGORIES.index(name)] = level
+
+        self.file = open(path, 'wb', buffering=Tracer.BUFFER_SIZE)
+
+        # Bound once: record() is called from instrumented hot paths
+        write, pack = self.file.write, RECORD.pack
+        def record(category, event, addr, value, clk):
+            write(pack(category, event, addr & 0xffff, value & 0xffff, clk & 0xffff))
+        self.record = record
+
+    def level(self, category):
+        return self.levels[category]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read(path):
+    ''' Iterate over the records of a trace file:
+        (category, event, addr, value, clk_cycles)
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    return RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size])
+
+
+def dump(path):
+    ''' Print a trace file as text '''
+    for category, event, addr, value, clk in read(path):
+        print("{:3d} {:4s} {:5s} 0x{:04X} 0x{:02X}".format(
+            clk, CATEGORIES[category], EVENTS[event], addr, value))
+
+
+if __name__ == '__main__':
+    dump(sys.argv[1])
@@ -0,0 +1,167 @@
+#
+# Vectorized environments
+#
+# N AtariEnv (see env.py) stepped in lockstep, one worker process each (each one
+# owns its own System, cpu, TIA and RIOT):
+#
+#   with VecAtari("prueba.bin", 32, obs_type="screen", repeat=4) as envs:
+#       obs = envs.reset()                    # (32, 212, 160) uint8
+#       obs, rewards, dones, infos = envs.step(actions)
+#
+# Nothing is pickled while stepping. Workers and the main process share:
+# - obs:    (N, *obs_shape) uint8 array in multiprocessing.shared_memory
+# - control arrays (RawArray): command, actions, rewards, dones, frames
+# and synchronize with two barriers (N workers + main process) per command:
+# 'start' (command and actions are ready) and 'finished' (results are ready).
+#
+# Like AtariEnv, the returned arrays are views overwritten by the next
+# step/reset. Environments are reset automatically at the end of their
+# episodes: the returned observation is then the one after the reset (the
+# final frame count is still reported in infos).
+#
+# reward_fn/done_fn are sent to the workers when they start, so they must be
+# picklable if the multiprocessing start method is not 'fork'.
+#
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from env import AtariEnv
+
+def _worker(index, rom, env_args, obs_name, obs_shape, command, actions, rewards, dones, frames, start, finished):
+    ''' Worker process main loop: run the commands of the main process on
+        environment 'index'
+    '''
+    shm = shared_memory.SharedMemory(name=obs_name)
+    obs = None
+    try:
+        obs = np.ndarray(obs_shape, dtype=np.uint8, buffer=shm.buf)[index]
+        env = AtariEnv(rom, **env_args)
+
+        while True:
+            start.wait()
+            cmd = command.value
+            if cmd == VecAtari.CMD_CLOSE:
+                break
+
+            if cmd == VecAtari.CMD_STEP:
+                obs_env, reward, done, info = env.step(actions[index])
+                rewards[index] = reward
+                dones[index]   = done
+                frames[index]  = info["frame"]
+                if done:
+                    obs_env = env.reset()
+            else: # CMD_RESET
+                obs_env = env.reset()
+                rewards[index] = 0
+                dones[index]   = False
+                frames[index]  = 0
+
+            obs[...] = obs_env
+            finished.wait()
+    except Exception:
+        # Wake up the main process (BrokenBarrierError) instead of hanging it
+        start.abort()
+        finished.abort()
+        raise
+    finally:
+        del obs
+        shm.close()
+
+class VecAtari:
+
+    # Commands
+    CMD_STEP  = 0
+    CMD_RESET = 1
+    CMD_CLOSE = 2
+
+    def __init__(self, rom, n, obs_type="ram", repeat=1, max_frames=None, reward_fn=None, done_fn=None, context=None):
+        ''' rom: cartridge image (bytes) or path to it
+            n:   number of environments (worker processes)
+            obs_type, repeat, max_frames, reward_fn, done_fn: see AtariEnv
+            context: multiprocessing start method (default: platform default)
+        '''
+        if obs_type not in AtariEnv.OBS_TYPES:
+            raise ValueError("obs_type must be one of {}".format(AtariEnv.OBS_TYPES))
+        if not isinstance(rom, (bytes, bytearray)):
+            with open(rom, "rb") as f:
+                rom = f.read()
+
+        ctx = mp.get_context(context)
+        self.n = n
+        self.closed = False
+
+        # Observations
+        self.obs_shape = (n,) + AtariEnv.OBS_SHAPES[obs_type]
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.obs_shape)))
+        self.obs = np.ndarray(self.obs_shape, dtype=np.uint8, buffer=self.shm.buf)
+
+        # Control
+        self.command  = ctx.RawValue('i', VecAtari.CMD_RESET)
+        self._actions = ctx.RawArray('i', n)
+        self._rewards = ctx.RawArray('d', n)
+        self._dones   = ctx.RawArray('b', n)
+        self._frames  = ctx.RawArray('q', n)
+        self.actions = np.frombuffer(self._actions, dtype=np.int32)
+        self.rewards = np.frombuffer(self._rewards, dtype=np.float64)
+        self.dones   = np.frombuffer(self._dones, dtype=np.int8).view(np.bool_)
+        self.frames  = np.frombuffer(self._frames, dtype=np.int64)
+
+        self.start    = ctx.Barrier(n + 1)
+        self.finished = ctx.Barrier(n + 1)
+
+        env_args = dict(obs_type=obs_type, repeat=repeat, max_frames=max_frames,
+                        reward_fn=reward_fn, done_fn=done_fn)
+        self.workers = []
+        for i in range(n):
+            worker = ctx.Process(target=_worker, daemon=True,
+                                 args=(i, bytes(rom), env_args, self.shm.name, self.obs_shape,
+                                       self.command, self._actions, self._rewards, self._dones,
+                                       self._frames, self.start, self.finished))
+            worker.start()
+            self.workers.append(worker)
+
+    def _run(self, cmd):
+        self.command.value = cmd
+        self.start.wait()
+        self.finished.wait()
+
+    def reset(self):
+        ''' Reset all the environments. Returns the observations '''
+        self._run(VecAtari.CMD_RESET)
+        return self.obs
+
+    def step(self, actions):
+        ''' Step every environment with its action (see AtariEnv actions).
+            Returns (obs, rewards, dones, infos)
+        '''
+        self.actions[:] = actions
+        self._run(VecAtari.CMD_STEP)
+        infos = [{"frame": int(frame)} for frame in self.frames]
+        return self.obs, self.rewards, self.dones, infos
+
+    def close(self):
+        ''' Stop the workers and release the shared memory '''
+        if self.closed:
+            return
+        self.closed = True
+        self.command.value = VecAtari.CMD_CLOSE
+        try:
+            self.start.wait(timeout=5)
+        except Exception:
+            pass # Broken barrier: some worker already failed
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        del self.obs
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # Observations still referenced by the caller: freed with them
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,111 @@
+#
+# Video output
+#
+# At the end of each frame the TIA hands its framebuffer (TIA.screen, NTSC
+# palette indices) to a video output (see TIA.frame_update), as a (width,
+# height) transposed view. Any object with a frame(screen) method can be used
+# as one:
+# - NullVideo:   headless, the frame is only kept in TIA.screen
+# - PygameVideo: window with keyboard input. pygame is only imported when this
+#                output is created, so headless runs do not need it
+#
+import sys
+
+class NullVideo:
+
+    def frame(self, screen):
+        pass
+
+class PygameVideo:
+
+    SCALE = 3 # Window pixels per TIA pixel (vertically; TIA pixels are 2:1)
+
+    def __init__(self, system, palette, size=(160, 192+20)):
+        ''' system:  input registers are written on key events (Atari2600
+                     sets it on every reset)
+            palette: RGB color of each palette index (i.e.: TIA.colorMap)
+            size:    framebuffer size (width, height)
+        '''
+        import pygame
+        self.pygame = pygame
+        self.system = system
+
+        width, height = size
+        self.window_size = (2*width*PygameVideo.SCALE, height*PygameVideo.SCALE)
+
+        pygame.init()
+        # Scaling by is faster than using pygame.SCALED flag
+        self.display = pygame.display.set_mode(self.window_size)
+        # 8-bit surface: the screen (palette indices) is blitted as is
+        self.surface = pygame.Surface(size, depth=8)
+        self.surface.set_palette(palette)
+
+    def frame(self, screen):
+        pygame = self.pygame
+
+        pygame.surfarray.blit_array(self.surface, screen)
+        self.display.blit(pygame.transform.scale(self.surface, self.window_size), (0, 0))
+        pygame.display.flip()
+
+        # Input keyboard
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit();
+                sys.exit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_0:
+                    self.system.memory[0x282] &= ~0x01    # reset
+                elif event.key == pygame.K_1:
+                    self.system.memory[0x282] &= ~0x02    # select
+                elif event.key == pygame.K_l:
+                    self.system.memory[0x280] &= ~0x80    # P0 right
+                elif event.key == pygame.K_j:
+                    self.system.memory[0x280] &= ~0x40    # P0 left
+                elif event.key == pygame.K_k:
+                    self.system.memory[0x280] &= ~0x20    # P0 down
+                elif event.key == pygame.K_i:
+                    self.system.memory[0x280] &= ~0x10    # P0 up
+                elif event.key == pygame.K_d:
+                    self.system.memory[0x280] &= ~0x08    # P1 right
+                elif event.key == pygame.K_a:
+                    self.system.memory[0x280] &= ~0x04    # P1 left
+                elif event.key == pygame.K_s:
+                    self.system.memory[0x280] &= ~0x02    # P1 down
+                elif event.key == pygame.K_w:
+                    self.system.memory[0x280] &= ~0x01    # P1 up
+                elif event.key == pygame.K_2:
+                    self.system.memory[0x282] ^= 0x80     # P0 difficulty 
+                elif event.key == pygame.K_3:
+                    self.system.memory[0x282] ^= 0x40     # P1 difficulty
+
+                elif event.key == pygame.K_m:
+                    self.system.memory[0x10C] &= ~0x80     # P0 button
+                elif event.key == pygame.K_x:
+                    self.system.memory[0x10D] &= ~0x80     # P1 button
+
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_0:
+                    self.system.memory[0x282] |= 0x01
+                elif event.key == pygame.K_1:
+                    self.system.memory[0x282] |= 0x02
+                elif event.key == pygame.K_l:
+                    self.system.memory[0x280] |= 0x80    # P0 right
+                elif event.key == pygame.K_j:
+                    self.system.memory[0x280] |= 0x40    # P0 left
+                elif event.key == pygame.K_k:
+                    self.system.memory[0x280] |= 0x20    # P0 down
+                elif event.key == pygame.K_i:
+                    self.system.memory[0x280] |= 0x10    # P0 up
+                elif event.key == pygame.K_d:
+                    self.system.memory[0x280] |= 0x08    # P1 right
+                elif event.key == pygame.K_a:
+                    self.system.memory[0x280] |= 0x04    # P1 left
+                elif event.key == pygame.K_s:
+                    self.system.memory[0x280] |= 0x02    # P1 down
+                elif event.key == pygame.K_w:
+                    self.system.memory[0x280] |= 0x01    # P1 up
+
+                elif event.key == pygame.K_m:
+                    self.system.memory[0x10C] |= 0x80     # P0 button
+                elif event.key == pygame.K_x:
+                    self.system.memory[0x10D] |= 0x80     # P1 button